@@ -1,18 +1,48 @@
-from dash import Dash, dcc, html, Input, Output, callback
-import plotly.express as px
+import time
+Start_Time = time.time()   # taken before the heavy imports, for the startup timings reported by /health
+
+from dash import Dash, dcc, html, Input, Output, State, ClientsideFunction, Patch, ctx, no_update
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
-import pandas as pd
 import numpy as np
 import dash_bootstrap_components as dbc
 import dash_daq as daq
+import os
 import random
+import threading
+import flask
+from partitions import find_partitions, PartitionCache, featX, Hist_Edges, Projection_Names
+from feature_stats import quantile
+from scatter_lod import thin_points
+from mlp_engine import design_name
+from callback_metrics import CallbackMetrics, cached
+
+# seconds from Start_Time to each startup stage; 'ready' is set by warm_up
+Startup_Times = {'imports': round(time.time()-Start_Time, 3)}
+# set once the caches are warm, /health answers 503 until then
+Ready = threading.Event()
+# duration, payload size and cache use of every callback request, on /metrics (see callback_metrics.py);
+# requests slower than ATLAS_SLOW_CALLBACK_MS are logged
+Callback_Metrics = CallbackMetrics(slow_ms=float(os.environ.get('ATLAS_SLOW_CALLBACK_MS', 1000)),
+                                   shared_dir=os.environ.get('ATLAS_METRICS_DIR'))
+
+# callbacks of the app, recorded here and registered on every app create_app makes: dash.callback keeps
+# them globally and hands them to the first app that serves a request only
+Callbacks = []
+
+def callback(*args, **kwargs):
+    def record(function):
+        Callbacks.append(('callback', args, kwargs, function))
+        return function
+    return record
+
+def clientside_callback(*args, **kwargs):
+    Callbacks.append(('clientside_callback', args, kwargs, None))
 
 # <script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>
 # <script id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>
 
 
-NN = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
-
 dark_theme = {
     'dark': True,
     'detail': '#007439',
@@ -20,23 +50,70 @@ dark_theme = {
     'secondary': '#6E6E6E',
 }
 
-# upload the scatter plot data sets
-df_scatter = pd.read_csv('G:/My Drive/Diss modelling/df_test.csv',index_col='index')
-
-# upload MLP and histogram data sets
-df_shortlist = pd.read_csv('G:/My Drive/Diss modelling/df_shortlist.csv',index_col='index')
-df_shortlist_scaled = pd.read_csv('G:/My Drive/Diss modelling/df_shortlist_scaled.csv',index_col='index')
+# move the histogram cut (line, significance, legend) in the browser, without server calls
+Clientside_Hist = True
+
+# folder with the data sets: columnar store built by data_store.py, or the original CSV files; it holds
+# one sub-folder per DM mass (DM_10, DM_300, ...) or the tables of a single mass (see partitions.py)
+Data_Dir = os.environ.get('ATLAS_DATA_DIR', 'G:/My Drive/Diss modelling')
+
+# signal masses of the data folder, and the data of the masses in use: each mass is loaded when first
+# selected and at most ATLAS_PARTITIONS of them are kept per process, least recently used evicted first.
+# Only column names and the feature statistics of a mass are read for the layout: its test set, slider index
+# and NN outputs (df_probs, score index and histogram counts) are read on first use or by warm_up.
+Masses = find_partitions(Data_Dir)
+partition = PartitionCache(Masses, maxsize=int(os.environ.get('ATLAS_PARTITIONS', 2)))
+# mass shown first: ATLAS_DM_MASS (GeV) if the data folder has it, the lightest one otherwise
+Default_Mass = f"DM_{os.environ.get('ATLAS_DM_MASS', 300)}"
+Default_Mass = Default_Mass if Default_Mass in Masses else next(iter(Masses))
+
+# bin centres of the histogram and the 'ideal' output shown while the MLP is off
+Hist_Centers = (Hist_Edges[:-1]+Hist_Edges[1:])/2
+Hist_Ideal = {0: np.histogram([0.02]*50, bins=Hist_Edges, weights=[1]*50)[0],
+              1: np.histogram([0.98]*50, bins=Hist_Edges, weights=[1]*50)[0]}
+
+# define features (the same for every mass)
+Features = partition(Default_Mass).features
+
+# define events: the 'real' data tab hides which one is the signal
+def events_real(P):
+    return ['unknown' if event == P.signal else event for event in P.events]
+
+# above this many events in the slider window the scatter plot is thinned
+Scatter_Max_Points = 20000
+
+# default window of the sliders as weighted quantiles (0 and 1: the full range), and the quantiles
+# marked on them (unlabelled ticks showing where the events lie)
+Slider_Window = (0., 1.)
+Slider_Marks = np.round(np.arange(0.1, 1., 0.1), 1)
+
+def slider_setup(P, feature):
+    # min, max, default window and marks of a slider along the feature, from the feature statistics
+    # of the mass (saved in its data folder, see feature_stats.py) without reading the rows
+    min_value = round(P.stats['features'][feature]['min'], 2)
+    max_value = round(P.stats['features'][feature]['max'], 2)
+    value = [round(quantile(P.stats, feature, q), 2) for q in Slider_Window]
+    marks = {round(quantile(P.stats, feature, q), 2): '' for q in Slider_Marks}
+    marks.update({min_value: f'{min_value:g}', max_value: f'{max_value:g}'})
+    return min_value, max_value, value, marks
+
+# 2D projections of the test set written to the store by projections.py, one tab each, read on first view
+Projections = partition(Default_Mass).projections
 
-df_probs = pd.read_csv('G:/My Drive/Diss modelling/df_probs_2022.csv',index_col='index')
-df_metrics = pd.read_csv('G:/My Drive/Diss modelling/df_metrics_2022.csv',index_col='index')
-
-# define features
-Features = df_scatter.drop(columns=['Event','totalWeight']).columns.to_list()
-featX = 'ETmiss'
-# define events
-Events_sim = df_scatter["Event"].unique() 
-Events_real = Events_sim.copy()
-Events_real[-1] = 'unknown'
+#####################################################################################
+#####################################################################################
+## Signal mass selector
+
+# one option per mass of the data folder, hidden when there is only one
+Mass_Selector = dbc.RadioItems(id='Mass_Selector',
+                               options=[{'label': f'{mass[3:]} GeV', 'value': mass} for mass in Masses],
+                               value=Default_Mass,
+                               className="btn-group",
+                               inputClassName="btn-check",
+                               labelClassName="btn btn-outline-primary",
+                               labelCheckedClassName="active",
+                               inline=True,
+                               )
 
 #####################################################################################
 #####################################################################################
@@ -53,15 +130,26 @@ ChooseY = dbc.RadioItems(id='ChooseY',
 
 
 # define slider controls along X
-min_value = df_scatter[f'{featX}'].min().round(2)
-max_value = df_scatter[f'{featX}'].max().round(2)
+min_value, max_value, value, marks = slider_setup(partition(Default_Mass), featX)
 SliderX = dcc.RangeSlider(id='SliderX',
                           min=min_value, 
                           max=max_value,
-                          value = [min_value, max_value],
+                          value = value,
+                          marks = marks,
                           #updatemode='drag',
                           persistence = True 
                           )
+# this updates the X-slider to another mass (the layout has the first one)
+@callback(
+          Output("SliderX", "min"),
+          Output("SliderX", "max"),
+          Output("SliderX", "value"),
+          Output("SliderX", "marks"),
+          Input("Mass_Selector", "value"),
+          prevent_initial_call=True,
+          )
+def range_slider_x(mass):
+    return slider_setup(partition(mass), featX)
 
 
 
@@ -77,16 +165,13 @@ SliderY = dcc.RangeSlider(id='SliderY',
           Output("SliderY", "min"),
           Output("SliderY", "max"),
           Output("SliderY", "value"),
+          Output("SliderY", "marks"),
           Input("ChooseY", "value"),
+          Input("Mass_Selector", "value"),
           )
-def range_slider_y(featY):
-    # define the data set to plot
-    df = df_scatter.copy()
-    # set values
-    min_value = df[f'{featY}'].min().round(2)
-    max_value = df[f'{featY}'].max().round(2)
-    value = [min_value, max_value]
-    return min_value, max_value, value
+def range_slider_y(featY, mass):
+    # set values from the feature statistics
+    return slider_setup(partition(mass), featY)
 
 
 
@@ -102,15 +187,19 @@ Tabs = dbc.Tabs([dbc.Tab(label="Simulated data", tab_id="tab-0"),
 # define events' checklist
 Pallete_legend = ['SkyBlue','Salmon','LimeGreen','SandyBrown','RoyalBlue']
 Legend_Scat = dbc.Checklist(
-                            id="Legend_Scat", value=Events_sim,
+                            id="Legend_Scat", value=partition(Default_Mass).events,
                             #labelStyle={"display": "flex", "align-items": "right"},
                             )   
-# this updates the Scatter plot's Legend
+# this updates the Scatter plot's Legend; another mass checks all of its events
 @callback(
           Output("Legend_Scat", "options"),
-          Input("Tabs", "active_tab")
+          Output("Legend_Scat", "value"),
+          Input("Tabs", "active_tab"),
+          Input("Mass_Selector", "value"),
           )
-def update_legend(tab):
+def update_legend(tab, mass):
+    P = partition(mass)
+    Events_sim, Events_real = P.events, events_real(P)
     options = [{"label": html.Div([event], style={'color':color, 'font-size':13, 'font-family':'Coustard Black'}),
                 "value": event} for event,color in zip(Events_sim,Pallete_legend)]  
 
@@ -118,7 +207,43 @@ def update_legend(tab):
         options = [{"label": html.Div([event_real], style={'color':color, 'font-size':13, 'font-family':'Coustard Black', 'text-opacity':1}),
                     "value": event_sim, "disabled": True} for event_real,color,event_sim in zip(Events_real,Pallete_legend,Events_sim)]
 
-    return options
+    value = Events_sim if 'Mass_Selector.value' in ctx.triggered_prop_ids else no_update
+    return options, value
+
+
+#####################################################################################
+#####################################################################################
+## Projection components
+
+
+# one tab per projection found in the data folder
+Projection_Tabs = dbc.Tabs([dbc.Tab(label=Projection_Names[method], tab_id=method) for method in Projections],
+                           id="Projection_Tabs",
+                           active_tab=Projections[0] if Projections else None,
+                           style={'font-family':'Coustard Black', 'font-size':14},
+                           )
+
+# events' checklist of the projection
+def legend_proj_options(P):
+    return [{"label": html.Div([event], style={'color':color, 'font-size':13, 'font-family':'Coustard Black'}),
+             "value": event} for event,color in zip(P.events,Pallete_legend)]
+
+Legend_Proj = dbc.Checklist(
+                            id="Legend_Proj", value=partition(Default_Mass).events,
+                            options=legend_proj_options(partition(Default_Mass)),
+                            )
+@callback(
+          Output("Legend_Proj", "options"),
+          Output("Legend_Proj", "value"),
+          Input("Mass_Selector", "value"),
+          prevent_initial_call=True,
+          )
+def update_legend_proj(mass):
+    P = partition(mass)
+    return legend_proj_options(P), P.events
+
+# zoom window of the projection shown, kept to update the sidebar when events are (un)checked
+Projection_Window = dcc.Store(id="Projection_Window")
 
 
 #####################################################################################
@@ -127,19 +252,24 @@ def update_legend(tab):
 
 
 # data selector
-Shortlist = []  # [{'label':'All Data', 'value':'data'}]
-for i in df_shortlist.index:
-    single_option = {}
-    single_option['label']=f'{i} - '+df_shortlist.Event[i]
-    single_option['value']=i
-    Shortlist.append(single_option)
+def shortlist_options(P):
+    return [{'label':f'{i} - {event}', 'value':i} for i,event in zip(P.df_shortlist.index, P.df_shortlist['Event'])]  # [{'label':'All Data', 'value':'data'}]
 Data_Dropdown = dcc.Dropdown(id='Data_Dropdown',
-                             options = Shortlist,
+                             options = shortlist_options(partition(Default_Mass)),
                              optionHeight=18,
                              clearable = False,
                              maxHeight = 500,
                              style={'font-family':'Coustard Black', 'font-size':10, 'color':'SlateGrey'}
                             )
+# the events of another mass (the selection is cleared)
+@callback(
+          Output("Data_Dropdown", "options"),
+          Output("Data_Dropdown", "value"),
+          Input("Mass_Selector", "value"),
+          prevent_initial_call=True,
+          )
+def update_shortlist(mass):
+    return shortlist_options(partition(mass)), None
 
 
 # scaler switch
@@ -296,33 +426,52 @@ F1_LED = daq.LEDDisplay(id='F1_LED',
                         label=dict(label='F1-score:', 
                                   style={'color':'Navy', 'font-size':11, 'font-family':'ROG Fonts', }),
                         )
+
+
+# model state shared by the LEDs, histogram and MLP: resolved once per change of the controls
+Model_State = dcc.Store(id='Model_State')
+
+def resolve_design(P, number_hl, HL1_size, HL2_size, HL3_size):
+    Nhl = number_hl             # number of hidden layers (1 to 3)
+    # the design trained with exactly these sizes, or else the nearest trained one (weight bank or df_probs)
+    return P.nearest_design([HL1_size, HL2_size, HL3_size][:Nhl])
+
 @callback(
-          Output("Accuracy_LED", "value"),
-          Output("Accuracy_LED", "color"), 
-          Output("F1_LED", "value"),
-          Output("F1_LED", "color"),          
+          Output("Model_State", "data"),
           Input('Scaler_Switch', 'on'),
           Input('Power_Button', 'on'),
           Input("NN_Depth", "value"),
           Input("HL1_Selector", "value"),
           Input("HL2_Selector", "value"),
           Input("HL3_Selector", "value"),
+          Input("Mass_Selector", "value"),
+          State("Model_State", "data"),
           )
-def update_led_values(scaler, power, number_hl, HL1_size, HL2_size, HL3_size):
-        
-    Nhl = number_hl   # number of hidden layers (1 to 3)    
-    hl1 = int(HL1_size) if HL1_size%2==0 else int(HL1_size+1)  # number of nods in the hidden layers
-    hl2 = int(HL2_size) if HL2_size%2==0 else int(HL2_size+1)
-    hl3 = int(HL3_size) if HL3_size%2==0 else int(HL3_size+1)
-    design = f'({hl1},)'  # design of MLP
-    if Nhl == 2:
-        design = f'({hl1}, {hl2})'
-    elif Nhl == 3:
-        design = f'({hl1}, {hl2}, {hl3})'
+def update_model_state(scaled, power, number_hl, HL1_size, HL2_size, HL3_size, mass, previous):
+    state = dict(mass = mass,
+                 design = resolve_design(partition(mass), number_hl, HL1_size, HL2_size, HL3_size),
+                 layers = [int(HL1_size), int(HL2_size), int(HL3_size)][:number_hl],  # neurons drawn per hidden layer
+                 scaled = scaled==True,
+                 power = power==True,
+                 active = scaled==True and power==True)
+    if state == previous:
+        raise PreventUpdate  # e.g. the selector of a disabled layer moved
+    return state
+
 
-    if scaler==True and power==True:
-        accuracy = df_metrics[design].Accuracy.round(2)
-        f1_score = df_metrics[design]['f1-score'].round(2)
+@callback(
+          Output("Accuracy_LED", "value"),
+          Output("Accuracy_LED", "color"), 
+          Output("F1_LED", "value"),
+          Output("F1_LED", "color"),          
+          Input("Model_State", "data"),
+          )
+def update_led_values(state):
+
+    if state['active']:
+        summary = partition(state['mass']).design_summary(state['design'])
+        accuracy = summary['accuracy']
+        f1_score = summary['f1_score']
         color = dark_theme['primary']
     else:
         accuracy = f1_score = "00.00"
@@ -362,48 +511,45 @@ def activate_hist_slider(scaler, power):
     return status, color, handleLabel
 
 
-# Label showing significance value    
-Signif_Hist = dbc.Label(id='Signif_Hist', 
-                       style={'font-size':26, 'font-family':'Coustard Black'})
+# weights kept above each cut, sent to the browser once per design
 @callback(
-          Output("Signif_Hist", "children"),
-          Output("Signif_Hist", "color"), 
-          Input('Scaler_Switch', 'on'),
-          Input('Power_Button', 'on'),
-          Input("NN_Depth", "value"),
-          Input("HL1_Selector", "value"),
-          Input("HL2_Selector", "value"),
-          Input("HL3_Selector", "value"),
-          Input("Hist_Slider", "value"),
+          Output("Hist_Data", "data"),
+          Input("Model_State", "data"),
           )
-def update_signif_hist(scaler, power, number_hl, HL1_size, HL2_size, HL3_size, cut):
-        
-    Nhl = number_hl             # number of hidden layers (1 to 3)    
-    hl1 = int(HL1_size) if HL1_size%2==0 else int(HL1_size+1)  # number of nods in the hidden layers
-    hl2 = int(HL2_size) if HL2_size%2==0 else int(HL2_size+1)
-    hl3 = int(HL3_size) if HL3_size%2==0 else int(HL3_size+1)
-    design = f'({hl1},)'        # design of MLP
-    if Nhl == 2:
-        design = f'({hl1}, {hl2})'
-    elif Nhl == 3:
-        design = f'({hl1}, {hl2}, {hl3})'
+def update_hist_data(state):
+    return dict(partition(state['mass']).design_summary(state['design'])['hist_data'], active=state['active'])
 
-    # make cut and calculate significance
-    df = df_probs[['Event','Weight',design]]
-    selection = df[df[design]>=cut]
 
-    W_sig = sum(selection[selection['Event']==1.0]['Weight'])
-    W_bkg = sum(selection['Weight']) - W_sig
-    S = (W_sig/np.sqrt(W_bkg)).round(2)
+# Label showing significance value    
+Signif_Hist = dbc.Label(id='Signif_Hist', 
+                       style={'font-size':26, 'font-family':'Coustard Black'})
+def update_signif_hist(state, cut):
 
-    if scaler==True and power==True:
-        significance = S
+    if state['active']:
+        # make cut and calculate significance
+        significance = partition(state['mass']).design_summary(state['design'])['index'].significance(cut).round(2)
         color = 'Green' #dark_theme['primary']
     else:
         significance = float(0)
         color = 'Maroon'
     return significance, color
 
+if Clientside_Hist:
+    clientside_callback(
+          ClientsideFunction(namespace='hist_cut', function_name='significance'),
+          Output("Signif_Hist", "children"),
+          Output("Signif_Hist", "color"),
+          Input("Hist_Slider", "value"),
+          Input("Hist_Data", "data"),
+          )
+else:
+    callback(
+          Output("Signif_Hist", "children"),
+          Output("Signif_Hist", "color"), 
+          Input("Model_State", "data"),
+          Input("Hist_Slider", "value"),
+          )(update_signif_hist)
+
 
 
 # define custom legend for the histogram
@@ -411,43 +557,16 @@ Legend_Hist = dbc.Checklist(
                             id="Legend_Hist", value=[0, 1],
                             #labelStyle={"display": "flex", "align-items": "right"},
                             )   
-@callback(
-    Output("Legend_Hist", "options"),
-    Input('Scaler_Switch', 'on'),
-    Input('Power_Button', 'on'),
-    Input("NN_Depth", "value"),
-    Input("HL1_Selector", "value"),
-    Input("HL2_Selector", "value"),
-    Input("HL3_Selector", "value"),
-    Input("Hist_Slider", "value"),
-    )
-def legend_hist_update(scaler, power, number_hl, HL1_size, HL2_size, HL3_size, cut):
-    
-    Nhl = number_hl             # number of hidden layers (1 to 3)    
-    hl1 = int(HL1_size) if HL1_size%2==0 else int(HL1_size+1)  # number of nods in the hidden layers
-    hl2 = int(HL2_size) if HL2_size%2==0 else int(HL2_size+1)
-    hl3 = int(HL3_size) if HL3_size%2==0 else int(HL3_size+1)
-    design = f'({hl1},)'        # design of MLP
-    if Nhl == 2:
-        design = f'({hl1}, {hl2})'
-    elif Nhl == 3:
-        design = f'({hl1}, {hl2}, {hl3})'
+def legend_hist_update(state, cut):
 
     # make selection and calculate number of events (sum of weights)
-    df = df_probs[['Event','Weight',design]]
-    selection = df[df[design]>=cut]
-
-    now_sig = round(sum(selection[selection['Event']==1.0]['Weight']), 1)
-    now_bkg = round((sum(selection['Weight']) - now_sig), 1)
-    full_sig = round(sum(df[df['Event']==1.0]['Weight']), 1)
-    full_bkg = round((sum(df['Weight']) - full_sig), 1)
-
-    if scaler==True and power==True:
+    if state['active']:
         status = False
-        now_sig = round(sum(selection[selection['Event']==1.0]['Weight']), 1)
-        now_bkg = round((sum(selection['Weight']) - now_sig), 1)
-        full_sig = round(sum(df[df['Event']==1.0]['Weight']), 1)
-        full_bkg = round((sum(df['Weight']) - full_sig), 1)
+        index = partition(state['mass']).design_summary(state['design'])['index']
+        now_sig, now_bkg = index.weights_above(cut)
+        full_sig, full_bkg = index.totals()
+        now_sig, now_bkg = round(now_sig, 1), round(now_bkg, 1)
+        full_sig, full_bkg = round(full_sig, 1), round(full_bkg, 1)
     else:
         status = True
         now_sig = now_bkg = full_sig = full_bkg = 50
@@ -466,13 +585,27 @@ def legend_hist_update(scaler, power, number_hl, HL1_size, HL2_size, HL3_size, c
               ]
     return options
 
+if Clientside_Hist:
+    clientside_callback(
+          ClientsideFunction(namespace='hist_cut', function_name='legend'),
+          Output("Legend_Hist", "options"),
+          Input("Hist_Slider", "value"),
+          Input("Hist_Data", "data"),
+          )
+else:
+    callback(
+          Output("Legend_Hist", "options"),
+          Input("Model_State", "data"),
+          Input("Hist_Slider", "value"),
+          )(legend_hist_update)
+
 
 ####################################################################################################################################################
 ####################################################################################################################################################
 ## App layout
 
 
-NN.layout = dbc.Container([
+Layout = dbc.Container([
     
     #####################  Scatter plot section ############################################    
     
@@ -496,6 +629,13 @@ NN.layout = dbc.Container([
                           
                     width={"size": 8, "offset": 2})),
 
+    # mass of the dark matter signal shown in every section (only with several masses in the data folder)
+    dbc.Row(dbc.Col([dbc.Label('Dark matter mass:',
+                               style={'font-size':16, 'marginRight':20, 'font-family':'Coustard Black', 'color':'DimGray'}),
+                     Mass_Selector],
+                    width={"size": 8, "offset": 2}),
+            style={} if len(Masses) > 1 else {'display':'none'}),
+
     dbc.Row([
             dbc.Col([
                       dbc.Label('Select Y-parameter:',
@@ -543,7 +683,7 @@ NN.layout = dbc.Container([
             ), 
 
     html.Br(),
-    dbc.Row(dbc.Col([
+    dbc.Row(dbc.Col(
             dcc.Markdown("For convenience, we can approximate our complex 10-dimensional data set to a 2D projection. \
                          Popular algorithms for such visualisation are UMAP, PCA and t-SNE (check the tabs). \
                          Now there is no need to go through multiple combinations of parameters. \
@@ -551,7 +691,29 @@ NN.layout = dbc.Container([
                          And still hardly can isolate the signal (Dark Matter) by optimising the cut(s).",
 
                          style={'font-size':14, 'font-family':'Coustard'}),
-            html.Br(),
+                     width={"size": 8, "offset": 2})),
+
+    #####################  Projection section ##############################################
+
+    dbc.Row([
+            dbc.Col([Projection_Tabs,
+                     dcc.Graph(id="Projection", config={'displayModeBar':False}),
+                     Projection_Window,
+                     ],
+                    width={"size": 7, "offset": 3},
+                    ),
+            dbc.Col(Legend_Proj,
+                    width={"size": 2, "offset": 0},
+                    style={'marginTop':145, 'marginLeft':5},
+                    align='start'
+                    )
+            ],
+            align="center",
+            className="g-0",
+            ),
+
+    html.Br(),
+    dbc.Row(dbc.Col([
             dcc.Markdown("Imagine there are not 10, but 40+ parameters to consider... In such case machine learning inventory can come handy. \
                          Machine learning algorithms are capable of identifying (very) complex patterns and classifying the Signal (dark matter) from the Background (the other events). \
                          Among different algorithms, *neural networks* (NN) often produce the best results in HEP. \
@@ -619,6 +781,7 @@ NN.layout = dbc.Container([
                             #daq.DarkThemeProvider(theme=dark_theme, children=Accuracy_LED)], body=True),
                 ],
                 width=2),
+            Model_State,
             ], align='center'),
     
     # Sankey diagramm section
@@ -635,6 +798,8 @@ NN.layout = dbc.Container([
     dbc.Row([dbc.Col([
                     dbc.Col(dcc.Graph(id="Hist", config={'displayModeBar':False}),
                             ),
+                    dcc.Store(id="Hist_Base"),
+                    dcc.Store(id="Hist_Data"),
                     html.Br(),
                     dbc.Col(Hist_Slider, 
                             style={'margin-left':104}),                             
@@ -667,6 +832,23 @@ NN.layout = dbc.Container([
                             ], width={"size": 8, "offset": 2}),
                     align='center'),
     html.Br(),
+
+    ####################################################################
+    #####################  Best cut section ############################
+
+    dbc.Row([dbc.Col(dcc.Graph(id="Best_Cut", config={'displayModeBar':False}),
+                     width={"size": 6, "offset": 2}),
+            dbc.Col([
+                     dbc.Label('Best cut:', style={'font-size':16, 'marginBottom':20, 'font-family':'Coustard Black', 'color':'DimGray'}),
+                     html.Br(),
+                     dbc.Label(id='Best_Cut_Label', style={'font-size':14, 'font-family':'Coustard'}),
+                     ],
+                    width={"size": 2, "offset": 0},
+                    style={'margin-top':60},
+                    align='start')
+            ],
+            align='center'),
+    html.Br(),
     html.Br(),
     ])
 
@@ -675,75 +857,42 @@ NN.layout = dbc.Container([
 ## Scatter plot updates
 
 
-@callback(
-          Output("Scatter", "figure"),
-          Input("ChooseY", "value"),
-          Input('SliderX', 'value'),
-          Input('SliderY', 'value'),
-          Input("Tabs", "active_tab"),
-          Input("Legend_Scat", "value"),    
-          )
-def update_scatter(featY, sliderX, sliderY, active_tab, events):
-    
-    # define the data set to plot
-    df = df_scatter.copy()
-    Pallete = {'Non-resonant_ll':'skyblue', 'Z+jets':'salmon', 'WZ':'lightgreen', 'ZZ':'wheat', 'DM_300':'navy'}
-    #featX = 'ETmiss'
+# colours of the background events in the scatter plots; the signal of every mass is drawn in Signal_Color
+Event_Colors = {'Non-resonant_ll':'skyblue', 'Z+jets':'salmon', 'WZ':'lightgreen', 'ZZ':'wheat'}
+Signal_Color = 'navy'
+
+# colours, title and hover of the scatter plot: the 'real' data tab greys out the events
+def scatter_style(active_tab, events):
+    Pallete = {event: Event_Colors.get(event, Signal_Color) for event in events}
     Hover = 'closest'
     #Hover_data = {'Event':True, featX:True, featY:True}
     #Color_counts = 'SteelBlue'
-    if active_tab == "tab-0":        
-        Title = "Events in simulated data"        
-    elif active_tab == "tab-1":
+    Title = "Events in simulated data"
+    if active_tab == "tab-1":
         Title = "Events in 'real' data"
         #Color_counts = 'White'
-        Pallete = {'Non-resonant_ll':'DimGray', 'Z+jets':'DimGray', 'WZ':'DimGray', 'ZZ':'DimGray', 'DM_300':'DimGray'}
+        Pallete = {event: 'DimGray' for event in events}
         Hover = False
         #Hover_data = {'Event':False, featX:True, featY:True}
+    return Pallete, Title, Hover
 
-    # enable cuts with the sliders
-    Xlow, Xhigh = sliderX
-    Ylow, Yhigh = sliderY    
-    mask = (df[f'{featX}'] >= Xlow) & (df[f'{featX}'] <= Xhigh) & (df[f'{featY}'] >= Ylow) & (df[f'{featY}'] <= Yhigh)
-    df_masked=df[mask]
-    df_filt = df_masked[df_masked["Event"].isin(events)]
-  
-    fig = px.scatter(
-                      df_filt, x=featX, y=featY, color='Event',
-                      #size='follyWeight', #size_max=10,
-                      labels={'color': 'Event'},    
-                      opacity = 0.5,
-                      template = 'plotly_white', #'simple_white',
-                      color_discrete_map=Pallete,
-                      range_x=[Xlow-(Xhigh-Xlow)*0.01, Xhigh+(Xhigh-Xlow)*0.01],
-                      range_y=[Ylow-(Yhigh-Ylow)*0.01, Yhigh+(Yhigh-Ylow)*0.01],
-                      #hover_data=Hover_data - does not work?
-                      )
-    
-    # customize font, etc.
-    fig.update_layout(
-                      font_family="Coustard", font_size=11, font_color="SlateGrey",
-                      showlegend=False,
-                      title=dict(text=Title, font=dict(family='Coustard Black', size=20), x=0.44, y=0.95),
-                      # legend_title=dict(font=dict(family='Coustard Black',color='DimGrey')),
-                      # legend_uirevision='foo',
-                      #paper_bgcolor="#303030",
-                      #width=700,
-                      margin=dict(l=0, r=130, b=0, t=50),
-                      hovermode=Hover
-                      )
 
-    fig.update_traces(marker={'line':{'width':2, 'color':'white'},
-                              'size':9
-                              },
-                      )
-    
+# significance and weights of the selected events inside the window, shown in the sidebar
+def scatter_sidebar(P, featY, sliderX, sliderY, events, index=None):
+    W_now = (index or P.scatter_index).weights_in(featY, sliderX, sliderY)
+    W_now[~np.isin(P.events, events)] = 0.
 
     # define significance through MC weights
-    W_sig = sum(df_filt[df_filt['Event']=='DM_300']['totalWeight'])
-    W_bkg = sum(df_filt['totalWeight']) - W_sig
+    W_sig = W_now[P.signal_code]
+    W_bkg = W_now.sum() - W_sig
     S = (W_sig/np.sqrt(W_bkg)).round(2)
+    now = [round(W_now[z],1) if event in events else 0 for z,event in enumerate(P.events)]
+    return S, now
 
+
+# sidebar of a scatter figure, drawn as fixed shapes: shapes[1] holds the significance and
+# shapes[3+2*z] the weight of event z in the window (the Patch updates rely on these positions)
+def add_sidebar(fig, S, now, totals, Events_sim):
     # significance score - header
     fig.add_shape(type="rect", xref="paper", yref="paper",
                   fillcolor="White", line_color="White", line_width=0.25,
@@ -765,58 +914,218 @@ def update_scatter(featY, sliderX, sliderY, active_tab, events):
                   ) 
     # counts of events
     for z,event in enumerate(Events_sim):
-        now = round(sum(df_filt[df_filt['Event']==event]['totalWeight']),1)
-        full = round(sum(df[df['Event']==event]['totalWeight']),1)
+        full = round(totals[z],1)
         fig.add_shape(type="rect", xref="paper", yref="paper",
                       fillcolor="White", line_color="White", line_width=0.25,
                       x0=1.08-0.04, x1=1.17-0.04, y0=0.88-0.074*(z+1)-0.03, y1=0.88-0.074*(z+1)+0.03,                  
-                      label=dict(text=f'{now}', textposition='middle right', font_size=13, font_color='SteelBlue', font_family='Coustard Black',) 
+                      label=dict(text=f'{now[z]}', textposition='middle right', font_size=13, font_color='SteelBlue', font_family='Coustard Black',) 
                       )
         fig.add_shape(type="rect", xref="paper", yref="paper",
                       fillcolor="White", line_color="White", line_width=0.25,
                       x0=1.17-0.04, x1=1.27-0.04, y0=0.88-0.074*(z+1)-0.03, y1=0.88-0.074*(z+1)+0.03,                  
                       label=dict(text=f'({full})', textposition='middle left', font_size=13, font_color='SteelBlue', font_family='Coustard',) 
-                      )      
+                      )
+
+
+# the figure has one trace per event (hidden when unchecked) and the sidebar of add_sidebar.
+# Switching tabs or events only restyles it, so those changes are sent as a Patch.
+@callback(
+          Output("Scatter", "figure"),
+          Input("ChooseY", "value"),
+          Input('SliderX', 'value'),
+          Input('SliderY', 'value'),
+          Input("Tabs", "active_tab"),
+          Input("Legend_Scat", "value"),    
+          Input("Mass_Selector", "value"),
+          )
+def update_scatter(featY, sliderX, sliderY, active_tab, events, mass):
+    
+    P = partition(mass)
+    Events_sim = P.events
+    Pallete, Title, Hover = scatter_style(active_tab, Events_sim)
+
+    triggered = {prop.split('.')[0] for prop in ctx.triggered_prop_ids}
+    if triggered and triggered <= {'Tabs', 'Legend_Scat'}:
+        fig = Patch()
+        for z,event in enumerate(Events_sim):
+            fig['data'][z]['visible'] = event in events
+            fig['data'][z]['marker']['color'] = Pallete[event]
+        fig['layout']['title']['text'] = Title
+        fig['layout']['hovermode'] = Hover
+        if 'Legend_Scat' in triggered:
+            S, now = scatter_sidebar(P, featY, sliderX, sliderY, events)
+            fig['layout']['shapes'][1]['label']['text'] = float(S)
+            for z in range(len(Events_sim)):
+                fig['layout']['shapes'][3+2*z]['label']['text'] = f'{now[z]}'
+        return fig
+
+    # define the data set to plot
+    x, y = P.df_scatter[featX].to_numpy(), P.df_scatter[featY].to_numpy()
+    #featX = 'ETmiss'
+
+    # enable cuts with the sliders
+    Xlow, Xhigh = sliderX
+    Ylow, Yhigh = sliderY    
+    rows = np.flatnonzero((x >= Xlow) & (x <= Xhigh) & (y >= Ylow) & (y <= Yhigh))
+  
+    # thin the window to a drawable number of points (the sidebar below still counts all of them)
+    show, show_weight = thin_points(x[rows], y[rows], P.codes[rows], P.scatter_index.weights[rows],
+                                    sliderX, sliderY, Scatter_Max_Points)
+    rows = rows[show]
+    # rows stay sorted, so the points of every event are a contiguous slice of them
+    bounds = np.searchsorted(rows, P.offsets)
+
+    # WebGL scatter, one trace per event
+    fig = go.Figure()
+    for z,event in enumerate(Events_sim):
+        on = slice(bounds[z], bounds[z+1])
+        fig.add_trace(go.Scattergl(
+                      x=x[rows[on]], y=y[rows[on]],
+                      mode='markers', name=event,
+                      visible=event in events,
+                      opacity = 0.5,
+                      marker=dict(color=Pallete[event]),
+                      customdata=show_weight[on].round(3),
+                      hovertemplate=f'Event={event}<br>{featX}=%{{x}}<br>{featY}=%{{y}}<br>weight=%{{customdata}}<extra></extra>',
+                      ))
+    fig.update_layout(
+                      template = 'plotly_white', #'simple_white',
+                      xaxis=dict(title=featX, range=[Xlow-(Xhigh-Xlow)*0.01, Xhigh+(Xhigh-Xlow)*0.01]),
+                      yaxis=dict(title=featY, range=[Ylow-(Yhigh-Ylow)*0.01, Yhigh+(Yhigh-Ylow)*0.01]),
+                      )
+    
+    # customize font, etc.
+    fig.update_layout(
+                      font_family="Coustard", font_size=11, font_color="SlateGrey",
+                      showlegend=False,
+                      title=dict(text=Title, font=dict(family='Coustard Black', size=20), x=0.44, y=0.95),
+                      # legend_title=dict(font=dict(family='Coustard Black',color='DimGrey')),
+                      # legend_uirevision='foo',
+                      #paper_bgcolor="#303030",
+                      #width=700,
+                      margin=dict(l=0, r=130, b=0, t=50),
+                      hovermode=Hover
+                      )
+
+    fig.update_traces(marker={'line':{'width':2, 'color':'white'},
+                              'size':9
+                              },
+                      )
+    
+
+    # weights of the selected events inside the window
+    S, now = scatter_sidebar(P, featY, sliderX, sliderY, events)
+    add_sidebar(fig, S, now, P.scatter_index.totals, Events_sim)
     
     return fig
 
 
+# projection tab: WebGL scatter of the 2D projection with the level of detail and sidebar of the
+# main scatter, for the zoomed window. Zooming (relayoutData) redraws the window at full detail;
+# (un)checking events only restyles it and is sent as a Patch.
+@callback(
+          Output("Projection", "figure"),
+          Output("Projection_Window", "data"),
+          Input("Projection_Tabs", "active_tab"),
+          Input("Legend_Proj", "value"),
+          Input("Projection", "relayoutData"),
+          Input("Mass_Selector", "value"),
+          State("Projection_Window", "data"),
+          )
+def update_projection(method, events, relayout, mass, window):
+    P = partition(mass)
+    Events_sim = P.events
+    if method is None or method not in P.projections:
+        fig = go.Figure()
+        fig.update_layout(template='plotly_white', xaxis_visible=False, yaxis_visible=False,
+                          annotations=[dict(text='No projections in the data folder (see projections.py)', showarrow=False,
+                                            font=dict(family='Coustard', size=14, color='SlateGrey'))])
+        return fig, None
+    Pallete = scatter_style('tab-0', Events_sim)[0]
+    data = P.projection(method)
+    triggered = {prop.split('.')[0] for prop in ctx.triggered_prop_ids}
+
+    # window: the full projection on a new tab or mass, then the zoomed ranges
+    if not window or window['method'] != method or window.get('mass') != mass or 'Projection_Tabs' in triggered:
+        window = dict(method=method, mass=mass, x=data['x_range'], y=data['y_range'])
+    if 'Projection' in triggered and triggered <= {'Projection'}:
+        relayout = relayout or {}
+        zoom = dict(window)
+        for axis, key in (('x', 'xaxis'), ('y', 'yaxis')):
+            if f'{key}.range[0]' in relayout:
+                zoom[axis] = [relayout[f'{key}.range[0]'], relayout[f'{key}.range[1]']]
+            elif relayout.get(f'{key}.autorange'):
+                zoom[axis] = data[f'{axis}_range']
+        if zoom == window:
+            raise PreventUpdate   # e.g. autosize of the first draw
+        window = zoom
+    (Xlow, Xhigh), (Ylow, Yhigh) = window['x'], window['y']
+
+    if triggered == {'Legend_Proj'}:
+        fig = Patch()
+        for z,event in enumerate(Events_sim):
+            fig['data'][z]['visible'] = event in events
+        S, now = scatter_sidebar(P, '1', window['x'], window['y'], events, data['index'])
+        fig['layout']['shapes'][1]['label']['text'] = float(S)
+        for z in range(len(Events_sim)):
+            fig['layout']['shapes'][3+2*z]['label']['text'] = f'{now[z]}'
+        return fig, window
+
+    # events in the window, thinned to a drawable number of points
+    df, index = data['df'], data['index']
+    x, y = df['0'].to_numpy(), df['1'].to_numpy()
+    rows = np.flatnonzero((x >= Xlow) & (x <= Xhigh) & (y >= Ylow) & (y <= Yhigh))
+    show, show_weight = thin_points(x[rows], y[rows], index.codes[rows], index.weights[rows],
+                                    window['x'], window['y'], Scatter_Max_Points)
+    rows = rows[show]
+    bounds = np.searchsorted(rows, data['offsets'])
+
+    fig = go.Figure()
+    for z,event in enumerate(Events_sim):
+        on = slice(bounds[z], bounds[z+1])
+        fig.add_trace(go.Scattergl(
+                      x=x[rows[on]], y=y[rows[on]],
+                      mode='markers', name=event,
+                      visible=event in events,
+                      opacity = 0.5,
+                      marker=dict(color=Pallete[event], line=dict(width=2, color='white'), size=9),
+                      customdata=show_weight[on].round(3),
+                      hovertemplate=f'Event={event}<br>weight=%{{customdata}}<extra></extra>',
+                      ))
+    fig.update_layout(
+                      template = 'plotly_white',
+                      xaxis=dict(title='1st component', range=[Xlow, Xhigh]),
+                      yaxis=dict(title='2nd component', range=[Ylow, Yhigh]),
+                      font_family="Coustard", font_size=11, font_color="SlateGrey",
+                      showlegend=False,
+                      title=dict(text=f'{Projection_Names[method]} projection', font=dict(family='Coustard Black', size=20), x=0.44, y=0.95),
+                      margin=dict(l=0, r=130, b=0, t=50),
+                      hovermode='closest',
+                      )
+    S, now = scatter_sidebar(P, '1', window['x'], window['y'], events, index)
+    add_sidebar(fig, S, now, index.totals, Events_sim)
+    return fig, window
+
+
 #####################################################################################
 #####################################################################################
 ## NN model updates
 
 
-@callback(
-          Output("MLP", "figure"), 
-          Input('Data_Dropdown', 'value'),
-          Input('Scaler_Switch', 'on'),
-          Input('Power_Button', 'on'),
-          Input("NN_Depth", "value"),
-          Input("HL1_Selector", "value"),
-          Input("HL2_Selector", "value"),
-          Input("HL3_Selector", "value"),
-          )
-def update_MLP(id, scaled, power, number_hl, HL1_size, HL2_size, HL3_size): 
-    
+# Sankey diagram of the MLP architecture: everything that depends only on the layer sizes.
+# Cached per architecture and mass, with the trained weights of the design when the weight bank of
+# the mass has it, or placeholder weights seeded by the architecture so they are stable between calls
+# and workers; update_MLP only lays the event values and colours over it.
+@cached(maxsize=64)
+def mlp_base(layers, mass):
+
     ### Inputs 
     f=len(Features)      # number of input features
     o=2                  # number of output nods = 2
     folly = 1            # folly hidden node(s) (for technical purposes)
-    Nhl = number_hl      # number of hidden layers (1 to 3)    
-    hl1 = int(HL1_size)  # number of nods in the hidden layers (1 to 10)
-    hl2 = hl3 = 0
-    a = int(HL1_size) if HL1_size%2==0 else int(HL1_size+1)
-    b = int(HL2_size) if HL2_size%2==0 else int(HL2_size+1)
-    c = int(HL3_size) if HL3_size%2==0 else int(HL3_size+1)
-    design = f'({a},)' # type of 'design' string
-    if Nhl == 2:
-        hl2 = int(HL2_size)
-        design = f'({a}, {b})'
-    elif Nhl == 3:
-        hl2 = int(HL2_size)
-        hl3 = int(HL3_size)
-        design = f'({a}, {b}, {c})'    
-        
+    Nhl = len(layers)                       # number of hidden layers (1 to 3)    
+    hl1, hl2, hl3 = layers + (0,)*(3-Nhl)   # number of nods in the hidden layers (1 to 10)
+    rand = random.Random(f'MLP {layers}')   # same 'weights' for the same design
 
     ### design logic
 
@@ -879,36 +1188,40 @@ def update_MLP(id, scaled, power, number_hl, HL1_size, HL2_size, HL3_size):
     Tfolly = np.array([Target[-1]+1,Target[-1]+1,Target[-1]+2]).flatten()
     Target = np.concatenate((Target, Tfolly))  # add source for folly
 
-    # value
-    Value = [round(random.uniform(0.005, 1),2) for _ in range(len(Source)-o-1)] +[0.0, 0.0, 1000.0]
-
-    # line color
-    Pos = random.sample(Value[:-(o+1)], int((len(Source)-o-1)/2))
-    Color_on = []  # links' colour
-    Weights = []  # links' info
-    for v in Value:
-        if v in Pos:
-            Color_on.append('Bisque')  # positive connectiions painted 'warm'
-            Weights.append(v)
-        elif v==0.0 or v==1000.0:
-            Color_on.append('White')  # folly connections painted white
-            Weights.append(v)            
-        else:
-            Color_on.append('PowderBlue')  # negative connectiions painted 'cold'
-            Weights.append(-v)
-    # for color in Color_on[-(o+1):]:
-    #     color = 'White'  
+    # value: trained weights when the design is in the weight bank, placeholders otherwise
+    design = design_name(layers)
+    Weight_Bank = partition(mass).weight_bank
+    if Weight_Bank is not None and design in Weight_Bank:
+        coefs = Weight_Bank.coefs(design)
+        # links to the output nodes go to (background, signal): the background logit is minus the signal one
+        W = np.concatenate([c.ravel() for c in coefs[:-1]] + [np.column_stack((-coefs[-1][:,0], coefs[-1][:,0])).ravel()])
+        Value = np.clip(abs(W)/abs(W).max(), 0.005, 1).round(2).tolist() +[0.0, 0.0, 1000.0]
+        Weights = W.round(2).tolist() +[0.0, 0.0, 1000.0]  # links' info
+        Color_on = ['Bisque' if w>0 else 'PowderBlue' for w in W] +(o+1)*['White']  # links' colour
+    else:
+        Value = [round(rand.uniform(0.005, 1),2) for _ in range(len(Source)-o-1)] +[0.0, 0.0, 1000.0]
+
+        # line color
+        Pos = rand.sample(Value[:-(o+1)], int((len(Source)-o-1)/2))
+        Color_on = []  # links' colour
+        Weights = []  # links' info
+        for v in Value:
+            if v in Pos:
+                Color_on.append('Bisque')  # positive connectiions painted 'warm'
+                Weights.append(v)
+            elif v==0.0 or v==1000.0:
+                Color_on.append('White')  # folly connections painted white
+                Weights.append(v)            
+            else:
+                Color_on.append('PowderBlue')  # negative connectiions painted 'cold'
+                Weights.append(-v)
+        # for color in Color_on[-(o+1):]:
+        #     color = 'White'  
   
+
     Color_off = ['WhiteSmoke' for color in Color_on[:-(o+1)]]+(o+1)*['White']
     Color_red = ['MistyRose' for color in Color_on[:-(o+1)]]+(o+1)*['White']
 
-    if power == True and scaled == True:
-        Color = Color_on
-    elif power == True and scaled == False:
-        Color = Color_red  
-    else:
-        Color = Color_off
-
 
     ########################################################### 
     # display figure
@@ -925,7 +1238,7 @@ def update_MLP(id, scaled, power, number_hl, HL1_size, HL2_size, HL3_size):
                               ),
                     link=dict(
                               arrowlen=25,
-                              color=Color,
+                              color=Color_off,
                               customdata=Weights,
                               hovertemplate = 'weight is %{customdata} <extra></extra>',
                               source = Source,
@@ -947,26 +1260,7 @@ def update_MLP(id, scaled, power, number_hl, HL1_size, HL2_size, HL3_size):
         )
 
 
-    # custom input nodes
-    if id is not None and scaled==True:
-        event = df_shortlist_scaled.loc[id]
-        color_input="ForestGreen"       
-    elif id is not None and scaled==False:
-        event = df_shortlist.drop(columns=['Event','totalWeight']).loc[id]
-        color_input='FireBrick'           
-    else:
-        event = df_shortlist_scaled.iloc[0]
-        color_input='WhiteSmoke'  # hides figures to imitate empty input
-
     for i in range(f):  
-        # input nodes shapes and values
-        MLP.add_shape(type="rect",
-                      xref="paper", yref="paper",
-                      fillcolor="WhiteSmoke",
-                      x0=x_pad-0.01, y0=(i+1)/(f+1)-0.03, x1=x_pad+0.035, y1=(i+1)/(f+1)+0.03,
-                      line_color="navy", line_width=0.25,
-                      label=dict(text=event[-i+(f-1)].round(2), font=dict(size=10, color=color_input))
-                      )
         # input feautures labels
         MLP.add_shape(type="rect", xref="paper", yref="paper",
                       fillcolor="white",
@@ -982,46 +1276,6 @@ def update_MLP(id, scaled, power, number_hl, HL1_size, HL2_size, HL3_size):
                   label=dict(text='Input Layer:', font_size=11)
                   )    
       
-
-    # custom output nodes
-    if id is not None and scaled==True and power==True:
-        sig_prob = df_probs[design][id]
-        bkg_prob = (1-sig_prob).round(2)
-        if sig_prob>=0.5:
-            Sig_Color="Bisque"
-            Bkg_Color='WhiteSmoke'
-            Sig_Size=16
-            Bkg_Size=12
-        else:
-            Sig_Color="WhiteSmoke"
-            Bkg_Color='PaleTurquoise'
-            Sig_Size=12
-            Bkg_Size=16
-        true_label=df_probs['Event'][id]
-        if (sig_prob>=0.5 and true_label==1) or (sig_prob<0.5 and true_label==0):
-            Text_Color='ForestGreen'
-        else:
-            Text_Color='FireBrick'           
-    else:
-        sig_prob = '-'
-        bkg_prob = '-'
-        Sig_Color=Bkg_Color="WhiteSmoke"
-        Sig_Size=Bkg_Size=12
-        Text_Color='Navy'
-    # signal ouput    
-    MLP.add_shape(type="rect", xref="paper", yref="paper",
-                  fillcolor=Sig_Color,
-                  x0=1-0.045, x1=1+0.045, y0=1/(o+1)-0.06, y1=1/(o+1)+0.06,
-                  line_color="Navy", line_width=0.25,
-                  label=dict(text=sig_prob, font=dict(color=Text_Color,size=Sig_Size))
-                  )
-    # background output
-    MLP.add_shape(type="rect", xref="paper", yref="paper",
-                  fillcolor=Bkg_Color,
-                  x0=1-0.045, x1=1+0.045, y0=2/(o+1)-0.06, y1=2/(o+1)+0.06,
-                  line_color="Navy", line_width=0.25,
-                  label=dict(text=bkg_prob, font=dict(color=Text_Color,size=Bkg_Size))
-                  ) 
     # output header
     MLP.add_shape(type="rect", xref="paper", yref="paper",
         fillcolor="white", line_color="white",
@@ -1102,8 +1356,110 @@ def update_MLP(id, scaled, power, number_hl, HL1_size, HL2_size, HL3_size):
                 line_color="Navy", line_width=1,
                 )
     
+    # validated once here, served as a plain dict afterwards
+    return dict(figure=MLP.to_plotly_json(), Color_on=Color_on, Color_off=Color_off, Color_red=Color_red)
+
+
+@callback(
+          Output("MLP", "figure"), 
+          Input('Data_Dropdown', 'value'),
+          Input("Model_State", "data"),
+          )
+def update_MLP(id, state): 
+    
+    f=len(Features)      # number of input features
+    o=2                  # number of output nods = 2
+    x_pad=0.10
+    design = state['design']
+    scaled = state['scaled']
+    power = state['power']
+    base = mlp_base(tuple(state['layers']), state['mass'])
+    P = partition(state['mass'])
+    if id not in P.df_shortlist.index:
+        id = None   # an event of the mass shown before
+
+    if power == True and scaled == True:
+        Color = base['Color_on']
+    elif power == True and scaled == False:
+        Color = base['Color_red']  
+    else:
+        Color = base['Color_off']
+
+
+    # custom input nodes
+    if id is not None and scaled==True:
+        event = P.df_shortlist_scaled.loc[id]
+        color_input="ForestGreen"       
+    elif id is not None and scaled==False:
+        event = P.df_shortlist.drop(columns=['Event','totalWeight']).loc[id]
+        color_input='FireBrick'           
+    else:
+        event = P.df_shortlist_scaled.iloc[0]
+        color_input='WhiteSmoke'  # hides figures to imitate empty input
+
+    Shapes = []
+    for i in range(f):  
+        # input nodes shapes and values
+        Shapes.append(dict(type="rect",
+                      xref="paper", yref="paper",
+                      fillcolor="WhiteSmoke",
+                      x0=x_pad-0.01, y0=(i+1)/(f+1)-0.03, x1=x_pad+0.035, y1=(i+1)/(f+1)+0.03,
+                      line=dict(color="navy", width=0.25),
+                      label=dict(text=str(round(float(event.iloc[-i+(f-1)]), 2)), font=dict(size=10, color=color_input))
+                      ))
+
+
+    # custom output nodes
+    if id is not None and scaled==True and power==True:
+        if P.weight_bank is not None and design in P.weight_bank:
+            # the unscaled features in the order of the bank, scored as bank_index scores the test set
+            features = P.df_shortlist.loc[[id], P.weight_bank.features or P.features]
+            sig_prob = round(float(P.weight_bank.predict_proba(design, features, scaled=False)[0]), 2)
+        else:
+            sig_prob = round(float(P.nn_outputs()[0][design][id]), 2)
+        bkg_prob = round(1-sig_prob, 2)
+        if sig_prob>=0.5:
+            Sig_Color="Bisque"
+            Bkg_Color='WhiteSmoke'
+            Sig_Size=16
+            Bkg_Size=12
+        else:
+            Sig_Color="WhiteSmoke"
+            Bkg_Color='PaleTurquoise'
+            Sig_Size=12
+            Bkg_Size=16
+        true_label=int(P.df_shortlist['Event'][id]==P.signal)
+        if (sig_prob>=0.5 and true_label==1) or (sig_prob<0.5 and true_label==0):
+            Text_Color='ForestGreen'
+        else:
+            Text_Color='FireBrick'           
+    else:
+        sig_prob = '-'
+        bkg_prob = '-'
+        Sig_Color=Bkg_Color="WhiteSmoke"
+        Sig_Size=Bkg_Size=12
+        Text_Color='Navy'
+    # signal ouput    
+    Shapes.append(dict(type="rect", xref="paper", yref="paper",
+                  fillcolor=Sig_Color,
+                  x0=1-0.045, x1=1+0.045, y0=1/(o+1)-0.06, y1=1/(o+1)+0.06,
+                  line=dict(color="Navy", width=0.25),
+                  label=dict(text=str(sig_prob), font=dict(color=Text_Color,size=Sig_Size))
+                  ))
+    # background output
+    Shapes.append(dict(type="rect", xref="paper", yref="paper",
+                  fillcolor=Bkg_Color,
+                  x0=1-0.045, x1=1+0.045, y0=2/(o+1)-0.06, y1=2/(o+1)+0.06,
+                  line=dict(color="Navy", width=0.25),
+                  label=dict(text=str(bkg_prob), font=dict(color=Text_Color,size=Bkg_Size))
+                  ))
+
 
-    return MLP
+    # lay the event over the cached figure (new dicts only, the cached one is shared)
+    figure = base['figure']
+    sankey = figure['data'][0]
+    return dict(data=[dict(sankey, link=dict(sankey['link'], color=Color))],
+                layout=dict(figure['layout'], shapes=figure['layout']['shapes']+Shapes))
 
 
 #####################################################################################
@@ -1111,58 +1467,47 @@ def update_MLP(id, scaled, power, number_hl, HL1_size, HL2_size, HL3_size):
 ## Histogram updates
 
 
+# in the browser mode the server only rebuilds the bars; the cut line is moved client-side.
+# Both bar traces are always drawn (hidden when unchecked) and the cut line is shapes[0], so moving
+# the slider or toggling the legend is sent as a Patch; the bars are rebuilt when the model changes.
 @callback(
-          Output("Hist", "figure"), 
-          Input('Scaler_Switch', 'on'),
-          Input('Power_Button', 'on'),
-          Input("NN_Depth", "value"),
-          Input("HL1_Selector", "value"),
-          Input("HL2_Selector", "value"),
-          Input("HL3_Selector", "value"),
-          Input('Hist_Slider', 'value'),
+          Output("Hist_Base", "data") if Clientside_Hist else Output("Hist", "figure"), 
+          Input("Model_State", "data"),
+          State('Hist_Slider', 'value') if Clientside_Hist else Input('Hist_Slider', 'value'),
           Input("Legend_Hist", "value"),
           )
-def update_hist(scaled, power, number_hl, HL1_size, HL2_size, HL3_size, cut, events): 
-    
-    Nhl = number_hl             # number of hidden layers (1 to 3)    
-    hl1 = int(HL1_size) if HL1_size%2==0 else int(HL1_size+1)  # number of nods in the hidden layers
-    hl2 = int(HL2_size) if HL2_size%2==0 else int(HL2_size+1)
-    hl3 = int(HL3_size) if HL3_size%2==0 else int(HL3_size+1)
-    design = f'({hl1},)'             # design of MLP
-    if Nhl == 2:
-        design = f'({hl1}, {hl2})'
-    elif Nhl == 3:
-        design = f'({hl1}, {hl2}, {hl3})'
-
-
-    if scaled==True and power==True:
-        df = df_probs.copy()
-        df_on = df[df["Event"].isin(events)]
-        X = df_on[design]
-        Color=['Signal' if i==1. else 'Background' for i in df_on['Event']]
+def update_hist(state, cut, events): 
+
+    triggered = {prop.split('.')[0] for prop in ctx.triggered_prop_ids}
+    if triggered and triggered <= {'Hist_Slider', 'Legend_Hist'}:
+        hist = Patch()
+        for i,event in enumerate([0,1]):
+            hist['data'][i]['visible'] = event in events
+        if not Clientside_Hist:
+            hist['layout']['shapes'][0]['x0'] = cut
+            hist['layout']['shapes'][0]['x1'] = cut
+        return hist
+
+    if state['active']:
+        Counts = partition(state['mass']).design_summary(state['design'])['counts']
         Title='Output of the Neural Network'
-        Y=df_on['Weight']
 
     else:
-        df = pd.DataFrame({'Event':np.array([0.]*50+[1.]*50),'v':np.array([0.02]*50+[0.98]*50),'w':np.array([1]*100)})
-        df_on = df[df["Event"].isin(events)]
-        X=df_on['v']
-        Color=['Signal' if i==0.98 else 'Background' for i in df_on['v']] 
+        Counts = Hist_Ideal
         Title='Ideal output. Activate MLP for reality'
-        Y=df_on['w']
 
 
-    # plot the histogram
-    hist = px.histogram( x=X, y=Y, color=Color,    #data_frame=df,                    
-                        #labels={'color': 'Event', f'{0.}':'Background', 1.:'Signal'},
-                        color_discrete_map={'Background':'SteelBlue','Signal':'Orange'},                        
-                        template = 'simple_white',
-                        log_y=True,
-                        barmode='overlay',                                                                
-                        )
+    # plot the histogram from the pre-binned weights
+    hist = go.Figure([go.Bar(x=Hist_Centers, y=Counts[event], width=Hist_Edges[1]-Hist_Edges[0],
+                             name=name, marker=dict(color=color, opacity=0.5), visible=event in events)
+                      for event,name,color in [(0,'Background','SteelBlue'), (1,'Signal','Orange')]],
+                     )
    
     # control layout
     hist.update_layout(
+                        template = 'simple_white',
+                        barmode='overlay',
+                        yaxis_type='log',
                         margin=dict(b=0, r=10),
                         title=dict(text=Title, font=dict(family='Coustard Black', size=14), x=0.6, y=0.95),
                         font_family='Coustard', font_size=11, font_color='SlateGrey',
@@ -1175,22 +1520,6 @@ def update_hist(scaled, power, number_hl, HL1_size, HL2_size, HL3_size, cut, eve
                         hovermode=False
                         )
     
-    hist.update_traces(
-                      #  lambda trace: trace.update(marker=dict(line=dict(color='Orange', width=0),
-                      #                                           pattern=dict(shape='', fgopacity=0.5, ))) if X <= cut else (),
-                       xbins=dict(size=0.05, start=0.0, end=1.0),
-                       )
-    
-    # hist.for_each_trace(
-    #                     # lambda trace: trace.update(marker=dict(line=dict(color='Orange', width=0),
-    #                     #                                        pattern=dict(shape='', fgopacity=0.5, ))) if trace.name == 'Signal' 
-    #                     # else trace.update(marker=dict(
-    #                     #                               line=dict(color='steelblue', width=0),
-    #                     #                               pattern=dict(shape='', fgopacity=0.5, fillmode='overlay'))),
-    #                     lambda trace: [trace.update(marker=dict(opacity=0.1,
-    #                                                pattern=dict(fgopacity=0.5, ))) for x in trace.x if x<cut],   
-    #                     )
-    
     hist.update_xaxes(tick0=0., dtick=0.1,
                       range=[-0.05,1.05],
                       fixedrange=True)
@@ -1223,6 +1552,114 @@ def update_hist(scaled, power, number_hl, HL1_size, HL2_size, HL3_size, cut, eve
     #                   )      
     return hist
 
+if Clientside_Hist:
+    clientside_callback(
+          ClientsideFunction(namespace='hist_cut', function_name='cut_line'),
+          Output("Hist", "figure"),
+          Input("Hist_Slider", "value"),
+          Input("Hist_Base", "data"),
+          )
+
+
+
+#####################################################################################
+#####################################################################################
+## Best cut updates
+
 
+@callback(
+          Output("Best_Cut", "figure"),
+          Output("Best_Cut_Label", "children"),
+          Input("Model_State", "data"),
+          )
+def update_best_cut(state):
+
+    table = partition(state['mass']).best_cut_table()
+
+    # maximum significance of every design, coloured by the cut reaching it
+    best = go.Figure(go.Scatter(x=table.index, y=table['significance'], mode='markers',
+                                customdata=table['cut'],
+                                marker=dict(color=table['cut'], colorscale='Blues', cmin=0., cmax=1., size=7,
+                                            colorbar=dict(title='cut', thickness=10)),
+                                hovertemplate='%{x}<br>best cut %{customdata:.3f}<br>significance %{y:.2f}<extra></extra>'))
+
+    if state['active'] and state['design'] in table.index:
+        cut, S = table.loc[state['design']]
+        # selected design
+        best.add_trace(go.Scatter(x=[state['design']], y=[S], mode='markers', hoverinfo='skip',
+                                  marker=dict(color='Orange', size=14, line=dict(color='Maroon', width=2))))
+        label = f'{state["design"]}: cut {cut:.3f}, significance {S:.2f}'
+    else:
+        design = table['significance'].idxmax()
+        label = f'highest of all designs: {design}, cut {table.loc[design, "cut"]:.3f}, significance {table["significance"].max():.2f}'
 
-NN.run_server(debug=True, port=7777)
\ No newline at end of file
+    best.update_layout(
+                        template = 'simple_white',
+                        margin=dict(b=0, r=10),
+                        title=dict(text='Maximum significance of every design', font=dict(family='Coustard Black', size=14), x=0.5, y=0.95),
+                        font_family='Coustard', font_size=11, font_color='SlateGrey',
+                        height=400,
+                        xaxis_title_text='MLP design',
+                        yaxis_title_text='significance',
+                        showlegend=False,
+                        )
+    best.update_xaxes(showticklabels=False, fixedrange=True)
+    best.update_yaxes(fixedrange=True)
+    return best, label
+
+
+
+####################################################################################################################################################
+####################################################################################################################################################
+## App
+
+
+# every app made here serves the layout and registers the callbacks above on itself;
+# config: keyword arguments of Dash (e.g. requests_pathname_prefix) and Flask settings under 'server'
+def create_app(config=None):
+    config = dict(config or {})
+    server_config = config.pop('server', {})
+    app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], **config)
+    app.layout = Layout
+    app.server.config.update(server_config)
+    for kind, args, kwargs, function in Callbacks:
+        register = getattr(app, kind)(*args, **kwargs)
+        if function is not None:
+            register(function)
+
+    # readiness for load balancers and rolling restarts: 503 until warm_up has run
+    @app.server.route('/health')
+    def health():
+        ready = Ready.is_set()
+        return flask.jsonify(ready=ready, startup=Startup_Times), 200 if ready else 503
+
+    Callback_Metrics.init_app(app)
+    return app
+
+
+# fill the lazy caches of the mass shown first now, e.g. in the WSGI master before it forks the workers
+# (see wsgi.py); other masses are loaded by the worker that first shows them
+def preload():
+    P = partition(Default_Mass)
+    P.best_cut_table()         # df_probs, score index, histogram and metrics of every design
+    for featY in Y_options:
+        P.scatter_index.feature(featY)
+    for method in P.projections:
+        P.projection(method)['index'].feature('1')
+
+def warm_up(preload_caches=True):
+    if preload_caches:
+        preload()
+    Startup_Times['ready'] = round(time.time()-Start_Time, 3)
+    Ready.set()
+
+
+Startup_Times['data'] = round(time.time()-Start_Time, 3)
+NN = create_app()
+server = NN.server             # WSGI application
+Startup_Times['app'] = round(time.time()-Start_Time, 3)
+
+if __name__ == '__main__':
+    # the dev server answers at once, the caches fill in the background
+    threading.Thread(target=warm_up, daemon=True).start()
+    NN.run(debug=True, port=7777)
\ No newline at end of file
@@ -0,0 +1,83 @@
+// Histogram cut interaction computed in the browser.
+// The server sends the weights kept above every Hist_Slider step once per design (Hist_Data store),
+// so dragging the slider only looks values up here and never calls back to the server.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    hist_cut: {
+
+        // significance label
+        significance: function(cut, data) {
+            if (!data || !data.active) {
+                return [0, 'Maroon'];
+            }
+            var k = cut_step(cut, data);
+            // no significance where no background is left: round-off of the running sums below
+            // bkg_tolerance of the total weight is none, as in ScoreIndex.significance
+            var total = Math.abs(data.full_sig + data.full_bkg);
+            if (!(data.bkg[k] > data.bkg_tolerance * total)) {
+                return [null, 'Green'];
+            }
+            var S = data.sig[k] / Math.sqrt(data.bkg[k]);
+            return [Math.round(S * 100) / 100, 'Green'];
+        },
+
+        // histogram legend with selected / total weights
+        legend: function(cut, data) {
+            var now_sig = 50, now_bkg = 50, full_sig = 50, full_bkg = 50;
+            var status = true;
+            if (data && data.active) {
+                var k = cut_step(cut, data);
+                status = false;
+                now_sig = round1(data.sig[k]);
+                now_bkg = round1(data.bkg[k]);
+                full_sig = round1(data.full_sig);
+                full_bkg = round1(data.full_bkg);
+            }
+            return [
+                {'label': legend_label('Background', 'SteelBlue', now_bkg, full_bkg), 'value': 0, 'disabled': status},
+                {'label': legend_label('Signal', 'SandyBrown', now_sig, full_sig), 'value': 1, 'disabled': status},
+            ];
+        },
+
+        // move the dashed cut line on the figure built by the server
+        cut_line: function(cut, figure) {
+            if (!figure) {
+                return window.dash_clientside.no_update;
+            }
+            var shapes = (figure.layout.shapes || []).map(function(shape) {
+                if (shape.line && shape.line.dash === 'dash') {
+                    return Object.assign({}, shape, {'x0': cut, 'x1': cut});
+                }
+                return shape;
+            });
+            var layout = Object.assign({}, figure.layout, {'shapes': shapes});
+            return Object.assign({}, figure, {'layout': layout});
+        },
+    }
+});
+
+
+// index of the slider step closest to the cut
+function cut_step(cut, data) {
+    var step = data.cuts[1] - data.cuts[0];
+    var k = Math.round((cut - data.cuts[0]) / step);
+    return Math.min(Math.max(k, 0), data.cuts.length - 1);
+}
+
+function round1(x) {
+    return (Math.round(x * 10) / 10).toFixed(1);
+}
+
+function legend_label(name, color, now, full) {
+    var bold = {'color': color, 'font-size': 13, 'font-family': 'Coustard Black'};
+    return {
+        'namespace': 'dash_html_components', 'type': 'Div',
+        'props': {'children': [
+            {'namespace': 'dash_bootstrap_components', 'type': 'Col', 'props': {'children': [name], 'style': bold}},
+            {'namespace': 'dash_bootstrap_components', 'type': 'Label', 'props': {'children': ['' + now], 'style': bold}},
+            {'namespace': 'dash_bootstrap_components', 'type': 'Label', 'props': {'children': ['/'], 'style': {'color': 'White', 'font-size': 13}}},
+            {'namespace': 'dash_bootstrap_components', 'type': 'Label',
+             'props': {'children': ['/ ' + full], 'style': {'color': color, 'font-size': 13, 'font-family': 'Coustard'}}},
+        ]}
+    };
+}
@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import subprocess
+import importlib.util
+import numpy as np
+
+
+# Benchmark of the server callbacks on synthetic data sets of growing size.
+# Every scale runs in a fresh process on its own data folder (built once and kept in
+# benchmarks/data/<events>); each callback is called directly with fixed arguments and timed:
+#   cold         first call (caches of the design still empty)
+#   median/min   of the following --repeat calls
+#   peak_mb      peak of Python/NumPy allocations during one call (tracemalloc)
+#   payload_kb   size of the JSON sent to the browser
+# Results are appended to results/callbacks.jsonl; each run is compared with the previous one of
+# the same callback and scale, and slowdowns above --threshold are reported as regressions.
+#
+#   python benchmarks/callbacks.py [--scales 10k 100k 1M 10M] [--repeat 5]
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, Root)
+Results = os.path.join(Root, 'benchmarks', 'results', 'callbacks.jsonl')
+Data = os.path.join(Root, 'benchmarks', 'data')
+
+Scales = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '10M': 10_000_000}
+
+Designs = ['(2,)', '(4,)', '(4, 6)', '(8, 8, 4)']
+
+
+def make_dataset(n, path, seed=0):
+    from synthetic_data import generate
+    generate(path, n, Designs, seed)
+
+
+def load_app():
+    spec = importlib.util.spec_from_file_location('visualisation_tool_nn', os.path.join(Root, 'Visualisation tool NN.py'))
+    app = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = app
+    spec.loader.exec_module(app)
+    return app
+
+
+def triggered(*props):
+    # callback context of a request changing the given properties (the callbacks read ctx.triggered_prop_ids)
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+    context_value.set(AttributeDict(triggered_inputs=[{'prop_id': prop, 'value': None} for prop in props]))
+
+
+def cases(app):
+    # callback name -> (properties that triggered it, function, arguments)
+    mass = app.Default_Mass
+    P = app.partition(mass)
+    df = P.df_scatter
+    events = list(P.events)
+    sliderX = [float(df[app.featX].min()), float(df[app.featX].quantile(0.9))]
+    sliderY = [float(df['mll'].min()), float(df['mll'].quantile(0.9))]
+    state = app.update_model_state(True, True, 2, 4, 6, 6, mass, None)
+    event_id = P.df_shortlist.index[0]
+    return {'update_scatter':        (['SliderX.value'], app.update_scatter, ('mll', sliderX, sliderY, 'tab-0', events, mass)),
+            'update_scatter_legend': (['Legend_Scat.value'], app.update_scatter, ('mll', sliderX, sliderY, 'tab-0', events[:3], mass)),
+            'range_slider_y':        (['ChooseY.value'], app.range_slider_y, ('mll', mass)),
+            'update_MLP':            (['Data_Dropdown.value'], app.update_MLP, (event_id, state)),
+            'update_hist':           (['Model_State.data'], app.update_hist, (state, 0.5, [0, 1])),
+            'update_hist_data':      (['Model_State.data'], app.update_hist_data, (state,)),
+            'update_signif_hist':    (['Hist_Slider.value'], app.update_signif_hist, (state, 0.5)),
+            'legend_hist_update':    (['Hist_Slider.value'], app.legend_hist_update, (state, 0.5)),
+            }
+
+
+def measure(args):
+    # worker: benchmark every callback against the data folder in ATLAS_DATA_DIR, print JSON
+    import plotly
+    app = load_app()
+    results = []
+    for name, (props, function, call_args) in cases(app).items():
+        triggered(*props)
+        start = time.perf_counter()
+        output = function(*call_args)
+        cold = time.perf_counter()-start
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            function(*call_args)
+            times.append(time.perf_counter()-start)
+        tracemalloc.start()
+        function(*call_args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        payload = len(json.dumps(output, cls=plotly.utils.PlotlyJSONEncoder))
+        results.append(dict(callback=name, cold_ms=round(cold*1000, 2), median_ms=round(float(np.median(times))*1000, 2),
+                            min_ms=round(min(times)*1000, 2), peak_mb=round(peak/2**20, 2), payload_kb=round(payload/1024, 2)))
+    print(json.dumps(results))
+
+
+def previous_results():
+    # last recorded result of every (scale, callback)
+    last = {}
+    if os.path.exists(Results):
+        with open(Results) as f:
+            for line in f:
+                record = json.loads(line)
+                last[record['scale'], record['callback']] = record
+    return last
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the app callbacks on synthetic data sets.')
+    parser.add_argument('--scales', nargs='+', choices=list(Scales), default=list(Scales))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as a regression')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        return measure(args)
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Root, capture_output=True, text=True).stdout.strip()
+    stamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    last = previous_results()
+    regressions = []
+    os.makedirs(os.path.dirname(Results), exist_ok=True)
+    for scale in args.scales:
+        path = os.path.join(Data, scale)
+        if not os.path.exists(os.path.join(path, 'df_probs', 'meta.json')):
+            print(f'building {scale} events data set in {path}')
+            make_dataset(Scales[scale], path)
+        env = dict(os.environ, ATLAS_DATA_DIR=path, ATLAS_PRELOAD='0')
+        worker = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', '--repeat', str(args.repeat)],
+                                env=env, capture_output=True, text=True)
+        if worker.returncode != 0:
+            print(worker.stderr)
+            raise RuntimeError(f'benchmark of {scale} failed')
+        results = json.loads(worker.stdout.strip().splitlines()[-1])
+
+        print(f'\n{scale} events')
+        print(f"{'callback':24}{'cold ms':>10}{'median ms':>11}{'peak MB':>10}{'payload KB':>12}{'vs last':>9}")
+        with open(Results, 'a') as f:
+            for result in results:
+                record = dict(time=stamp, commit=commit, scale=scale, events=Scales[scale], **result)
+                f.write(json.dumps(record)+'\n')
+                before = last.get((scale, result['callback']))
+                change = ''
+                if before and before['median_ms'] > 0:
+                    ratio = result['median_ms']/before['median_ms']
+                    change = f'{ratio:.2f}x'
+                    if ratio > 1+args.threshold:
+                        regressions.append(f"{result['callback']} at {scale}: {before['median_ms']} -> {result['median_ms']} ms "
+                                           f"({before['commit']} -> {commit})")
+                print(f"{result['callback']:24}{result['cold_ms']:>10}{result['median_ms']:>11}{result['peak_mb']:>10}"
+                      f"{result['payload_kb']:>12}{change:>9}")
+
+    if regressions:
+        print('\nslower than the last run:')
+        print('\n'.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.request
+import urllib.error
+import numpy as np
+from startup import Root, Serve, free_port, get
+
+
+# Load test: N simulated users replay interaction sequences against a running instance of the app and
+# post to /_dash-update-component as the browser does. Each user loads the page (every server callback,
+# in dependency order), then repeats random actions with a think time in between:
+#   ChooseY         picks another Y feature
+#   SliderX         drags the ETmiss range (sent on release, as the RangeSlider does)
+#   Scaler_Switch, Power_Button   flip the switch
+#   HL_Selector     scrolls a hidden layer size by a few steps, one request per step
+#   Data_Dropdown   picks another event for the MLP
+#   Mass_Selector   switches to another DM mass (data folders with several masses only)
+#   Hist_Slider     drags the cut (updatemode drag: every step is a change)
+# After a change, the server callbacks that take it as input are called, and so on with their outputs,
+# like the Dash renderer does. Clientside callbacks run in the browser and are not replayed, so an action
+# handled entirely in the browser (Hist_Slider) sends no request at all.
+#
+# Reported per callback (named by its outputs): requests, p50/p95/p99/max latency and errors, and the
+# throughput in requests and actions per second. Results are appended to results/load.jsonl.
+#
+#   python benchmarks/load.py [--users 1 4 16] [--duration 60] [--think 1.0] [--server werkzeug|gunicorn|URL]
+
+Results = os.path.join(Root, 'benchmarks', 'results', 'load.jsonl')
+Update = '/_dash-update-component'
+
+Actions = ['ChooseY', 'SliderX', 'Scaler_Switch', 'Power_Button', 'HL_Selector', 'Data_Dropdown', 'Hist_Slider', 'Mass_Selector']
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None, b''
+
+
+def get_json(url):
+    status, body = get(url)
+    if status != 200:
+        raise RuntimeError(f'{url} answered {status}')
+    return json.loads(body)
+
+
+def split_output(output):
+    # 'MLP.figure' or '..A.x...B.y..' -> [(id, property), ...]
+    parts = output[2:-2].split('...') if output.startswith('..') else [output]
+    return [tuple(part.rsplit('.', 1)) for part in parts]
+
+
+def layout_props(node, props):
+    # 'id.property' -> value of every component with an id in the layout
+    if isinstance(node, dict):
+        if 'type' in node and isinstance(node.get('props'), dict) and isinstance(node['props'].get('id'), str):
+            for prop, value in node['props'].items():
+                if prop != 'children':
+                    props[f"{node['props']['id']}.{prop}"] = value
+        for value in node.values():
+            layout_props(value, props)
+    elif isinstance(node, list):
+        for value in node:
+            layout_props(value, props)
+    return props
+
+
+class App:
+    # what every user needs to know about the app: its server callbacks and initial layout
+    def __init__(self, url):
+        self.url = url
+        self.layout = layout_props(get_json(url+'/_dash-layout'), {})
+        self.callbacks = []
+        for dependency in get_json(url+'/_dash-dependencies'):
+            if dependency.get('clientside_function'):
+                continue
+            outputs = split_output(dependency['output'])
+            self.callbacks.append(dict(output=dependency['output'], outputs=outputs,
+                                       name=f'{outputs[0][0]}.{outputs[0][1]}' + (f'+{len(outputs)-1}' if len(outputs) > 1 else ''),
+                                       inputs=[(i['id'], i['property']) for i in dependency['inputs']],
+                                       state=[(s['id'], s['property']) for s in dependency['state']]))
+
+    def triggered_by(self, changed):
+        return [i for i, callback in enumerate(self.callbacks) if any(f'{c}.{p}' in changed for c, p in callback['inputs'])]
+
+
+class User:
+
+    def __init__(self, app, seed, stats, lock):
+        self.app = app
+        self.values = dict(app.layout)
+        self.random = random.Random(seed)
+        self.stats = stats
+        self.lock = lock
+        self.actions = 0
+
+    def call(self, callback, changed):
+        body = dict(output=callback['output'],
+                    outputs=[dict(id=c, property=p) for c, p in callback['outputs']] if callback['output'].startswith('..')
+                            else dict(id=callback['outputs'][0][0], property=callback['outputs'][0][1]),
+                    inputs=[dict(id=c, property=p, value=self.values.get(f'{c}.{p}')) for c, p in callback['inputs']],
+                    state=[dict(id=c, property=p, value=self.values.get(f'{c}.{p}')) for c, p in callback['state']],
+                    changedPropIds=[f'{c}.{p}' for c, p in callback['inputs'] if f'{c}.{p}' in changed])
+        start = time.perf_counter()
+        status, data = post(self.app.url+Update, body)
+        seconds = time.perf_counter()-start
+        with self.lock:
+            self.stats.setdefault(callback['name'], []).append(seconds if status in (200, 204) else None)
+        if status != 200:
+            return set()   # 204: PreventUpdate, nothing changed
+        outputs = set()
+        for component, props in json.loads(data).get('response', {}).items():
+            for prop, value in props.items():
+                outputs.add(f'{component}.{prop}')
+                if not (isinstance(value, dict) and '__dash_patch_update' in value):
+                    self.values[f'{component}.{prop}'] = value
+        return outputs
+
+    def cascade(self, pending, changed):
+        # run the triggered callbacks, each only once the callbacks feeding its inputs have run
+        pending = dict.fromkeys(pending)
+        for _ in range(4*len(self.app.callbacks)):
+            if not pending:
+                return
+            waiting = {f'{c}.{p}' for i in pending for c, p in self.app.callbacks[i]['outputs']}
+            ready = [i for i in pending if not any(f'{c}.{p}' in waiting for c, p in self.app.callbacks[i]['inputs'])]
+            i = (ready or list(pending))[0]
+            del pending[i]
+            outputs = self.call(self.app.callbacks[i], changed)
+            changed = changed | outputs
+            pending.update(dict.fromkeys(self.app.triggered_by(outputs)))
+
+    def change(self, prop, value):
+        self.values[prop] = value
+        self.cascade(self.app.triggered_by({prop}), {prop})
+
+    def load_page(self):
+        self.cascade(range(len(self.app.callbacks)), set())
+
+    def options(self, component):
+        return [option['value'] if isinstance(option, dict) else option for option in self.values.get(f'{component}.options') or []]
+
+    def act(self, action):
+        r, values = self.random, self.values
+        if action == 'ChooseY':
+            self.change('ChooseY.value', r.choice(self.options('ChooseY')))
+        elif action == 'SliderX':
+            low, high = values['SliderX.min'], values['SliderX.max']
+            a, b = sorted(r.uniform(low, high) for _ in range(2))
+            self.change('SliderX.value', [round(a, 2), round(b, 2)])
+        elif action in ('Scaler_Switch', 'Power_Button'):
+            self.change(f'{action}.on', not values.get(f'{action}.on'))
+        elif action == 'HL_Selector':
+            selector = r.choice(['HL1_Selector', 'HL2_Selector', 'HL3_Selector'])
+            step = r.choice([-1, 1])
+            for _ in range(r.randint(1, 3)):
+                value = min(max(values.get(f'{selector}.value', 1)+step, values.get(f'{selector}.min', 1)), values.get(f'{selector}.max', 10))
+                self.change(f'{selector}.value', value)
+        elif action == 'Data_Dropdown':
+            self.change('Data_Dropdown.value', r.choice(self.options('Data_Dropdown')))
+        elif action == 'Mass_Selector':
+            masses = self.options('Mass_Selector')
+            if len(masses) < 2:
+                return   # one mass: the selector is hidden
+            self.change('Mass_Selector.value', r.choice(masses))
+        elif action == 'Hist_Slider':
+            step = values.get('Hist_Slider.step', 0.05)
+            for cut in np.round(np.arange(0., 1.+step/2, step), 2)[:r.randint(2, 10)]:
+                self.change('Hist_Slider.value', float(cut))
+        self.actions += 1
+
+    def run(self, stop, think):
+        self.load_page()
+        while not stop.is_set():
+            self.act(self.random.choice(Actions))
+            stop.wait(self.random.expovariate(1/think) if think > 0 else 0)
+
+
+def load_test(app, users, duration, think, seed):
+    stats, lock, stop = {}, threading.Lock(), threading.Event()
+    simulated = [User(app, seed+i, stats, lock) for i in range(users)]
+    threads = [threading.Thread(target=user.run, args=(stop, think), daemon=True) for user in simulated]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter()-start
+
+    callbacks = {}
+    for name, times in sorted(stats.items()):
+        ok = np.array([t for t in times if t is not None])*1000
+        callbacks[name] = dict(requests=len(times), errors=len(times)-len(ok),
+                               **({f'p{q}_ms': round(float(np.percentile(ok, q)), 2) for q in (50, 95, 99)} if len(ok) else {}),
+                               max_ms=round(float(ok.max()), 2) if len(ok) else None)
+    requests = sum(len(times) for times in stats.values())
+    return dict(users=users, seconds=round(elapsed, 2), requests=requests, actions=sum(user.actions for user in simulated),
+                requests_per_s=round(requests/elapsed, 2), actions_per_s=round(sum(user.actions for user in simulated)/elapsed, 2),
+                callbacks=callbacks)
+
+
+def start_server(server, workers):
+    port = free_port()
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(Root, 'gunicorn.conf.py'), '--chdir', Root,
+                   '--bind', f'127.0.0.1:{port}', 'wsgi:server'] + (['--workers', str(workers)] if workers else [])
+    else:
+        command = [sys.executable, '-c', Serve.format(root=Root, port=port)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process, f'http://127.0.0.1:{port}'
+
+
+def wait_ready(url, process, timeout):
+    start = time.time()
+    while time.time()-start < timeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        answer = get(url+'/health')
+        if answer is not None and answer[0] == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f'{url} not ready after {timeout} s')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay user sessions against the app with concurrent simulated users.')
+    parser.add_argument('--users', type=int, nargs='+', default=[1, 4, 16], help='concurrent users, one run per value')
+    parser.add_argument('--duration', type=float, default=60., help='seconds per run')
+    parser.add_argument('--think', type=float, default=1., help='mean pause between the actions of a user (s)')
+    parser.add_argument('--server', default='werkzeug', help='werkzeug or gunicorn (started here), or the URL of a running app')
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: gunicorn.conf.py)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=600., help='seconds to wait for /health')
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.server.startswith('http'):
+        url = args.server.rstrip('/')
+    else:
+        process, url = start_server(args.server, args.workers)
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Root, capture_output=True, text=True).stdout.strip()
+    os.makedirs(os.path.dirname(Results), exist_ok=True)
+    try:
+        wait_ready(url, process, args.timeout)
+        app = App(url)
+        for users in args.users:
+            result = load_test(app, users, args.duration, args.think, args.seed)
+            print(f"\n{users} users, {result['seconds']} s: {result['requests']} requests ({result['requests_per_s']}/s), "
+                  f"{result['actions']} actions ({result['actions_per_s']}/s)")
+            print(f"{'callback':28}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'errors':>8}")
+            for name, stats in result['callbacks'].items():
+                print(f"{name:28}{stats['requests']:>9}{stats.get('p50_ms', '-'):>9}{stats.get('p95_ms', '-'):>9}"
+                      f"{stats.get('p99_ms', '-'):>9}{stats['max_ms'] or '-':>9}{stats['errors']:>8}")
+            record = dict(time=time.strftime('%Y-%m-%dT%H:%M:%S'), commit=commit, server=args.server, workers=args.workers,
+                          think=args.think, data_dir=os.environ.get('ATLAS_DATA_DIR'), **result)
+            with open(Results, 'a') as f:
+                f.write(json.dumps(record)+'\n')
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
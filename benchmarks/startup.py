@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+import urllib.error
+
+
+# Startup benchmark: starts the WSGI app in a fresh process and times, from the spawn,
+#   listening   first answer of /health (the server accepts requests, caches may still be cold)
+#   first_page  first full response of the page and its layout
+#   ready       first 200 of /health (warm_up finished)
+# and appends the result (with the stages reported by the app itself) to results/startup.jsonl.
+#
+#   python benchmarks/startup.py [--preload 1|background|0] [--runs 3]
+
+Root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+Results = os.path.join(Root, 'benchmarks', 'results', 'startup.jsonl')
+
+# a plain threaded WSGI server, so the numbers do not depend on gunicorn being installed
+Serve = '''
+import sys
+sys.path.insert(0, {root!r})
+from werkzeug.serving import run_simple
+import wsgi
+run_simple('127.0.0.1', {port}, wsgi.server, threaded=True)
+'''
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def get(url):
+    # status and body, or None while nothing listens
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, error.read()
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return None
+
+
+def run_once(preload, timeout):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, ATLAS_PRELOAD=preload)
+    start = time.time()
+    process = subprocess.Popen([sys.executable, '-c', Serve.format(root=Root, port=port)], env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    times = {}
+    try:
+        while time.time()-start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f'server exited with code {process.returncode}')
+            answer = get(url+'/health')
+            if answer is None:
+                time.sleep(0.05)
+                continue
+            times.setdefault('listening', round(time.time()-start, 3))
+            if 'first_page' not in times and get(url+'/')[0] == 200 and get(url+'/_dash-layout')[0] == 200:
+                times['first_page'] = round(time.time()-start, 3)
+            if answer[0] == 200:
+                times['ready'] = round(time.time()-start, 3)
+                times['app'] = json.loads(answer[1])['startup']
+                return times
+            time.sleep(0.05)
+        raise RuntimeError(f'not ready after {timeout} s: {times}')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time from process start to first response and readiness.')
+    parser.add_argument('--preload', default='1', choices=['1', 'background', '0'], help='ATLAS_PRELOAD of the server')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=float, default=600.)
+    args = parser.parse_args(argv)
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Root, capture_output=True, text=True).stdout.strip()
+    os.makedirs(os.path.dirname(Results), exist_ok=True)
+    for run in range(args.runs):
+        times = run_once(args.preload, args.timeout)
+        record = dict(time=time.strftime('%Y-%m-%dT%H:%M:%S'), commit=commit, preload=args.preload,
+                      data_dir=os.environ.get('ATLAS_DATA_DIR'), **times)
+        print(f"run {run+1}: listening {times['listening']} s, first page {times.get('first_page')} s, ready {times['ready']} s")
+        with open(Results, 'a') as f:
+            f.write(json.dumps(record)+'\n')
+
+
+if __name__ == '__main__':
+    main()
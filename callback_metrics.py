@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import logging
+import functools
+import threading
+import flask
+
+
+# Per-callback instrumentation of a Dash app, served in the Prometheus text format on /metrics.
+# Every request to a server callback (/_dash-update-component) is recorded with:
+#   atlas_callback_duration_seconds  histogram of the time to answer, including the JSON encoding
+#   atlas_callback_payload_bytes     histogram of the size of the response sent to the browser
+#   atlas_callback_calls_total       calls by callback, triggering input and cache use (hit, miss or none)
+# Requests for outputs the app does not define are counted under the callback 'unknown',
+# and calls slower than slow_ms are logged with the same details.
+#
+# Cache use counts the functions decorated with cached() below that the callback called: 'miss' if any of
+# them had to compute, 'hit' if all answered from their cache, 'none' if it used no cached function.
+#
+# Each process keeps its own counts. With shared_dir (gunicorn.conf.py sets ATLAS_METRICS_DIR), every
+# process also saves them there, and /metrics adds up the files of all workers, whichever one answers.
+
+log = logging.getLogger('atlas.callbacks')
+
+Duration_Buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+Payload_Buckets = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+Dash_Update = '_dash-update-component'
+
+
+# calls and misses of the cached functions in the request handled by this thread
+class CacheUse(threading.local):
+    def __init__(self):
+        self.calls = 0
+        self.misses = 0
+
+Cache_Use = CacheUse()
+
+
+def cached(maxsize=None):
+    # functools.lru_cache that also counts its hits and misses for the callback being served
+    def decorator(function):
+        @functools.lru_cache(maxsize=maxsize)
+        def compute(*args, **kwargs):
+            Cache_Use.misses += 1
+            return function(*args, **kwargs)
+
+        @functools.wraps(function)
+        def lookup(*args, **kwargs):
+            Cache_Use.calls += 1
+            return compute(*args, **kwargs)
+        lookup.cache_info = compute.cache_info
+        lookup.cache_clear = compute.cache_clear
+        return lookup
+    return decorator
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def labels(**values):
+    return '{' + ','.join(f'{key}="{label_value(value)}"' for key, value in values.items()) + '}'
+
+
+class CallbackMetrics:
+
+    def __init__(self, slow_ms=1000., shared_dir=None, save_every=1.):
+        self.slow_ms = slow_ms
+        self.shared_dir = shared_dir
+        self.save_every = save_every
+        self.lock = threading.Lock()
+        # callback -> [count per bucket (last one +Inf), sum, count]
+        self.duration = {}
+        self.payload = {}
+        # 'callback\ttrigger\tcache' -> number of calls
+        self.calls = {}
+        self.saved = 0.
+
+    def init_app(self, app):
+        server = app.server
+
+        @server.before_request
+        def start_timer():
+            if flask.request.path.endswith(Dash_Update):
+                flask.g.callback_start = time.perf_counter()
+                Cache_Use.calls = Cache_Use.misses = 0
+
+        @server.after_request
+        def record(response):
+            start = flask.g.pop('callback_start', None)
+            if start is not None:
+                body = flask.request.get_json(silent=True) or {}
+                # labels only take values the app defines, so a client cannot add series or grow the saved files
+                entry = app.callback_map.get(body.get('output')) if isinstance(body.get('output'), str) else None
+                if entry is None:
+                    name, trigger = 'unknown', 'unknown'
+                else:
+                    name = getattr(entry.get('callback'), '__name__', 'unknown')
+                    inputs = {f"{i['id']}.{i['property']}" for i in entry.get('inputs', []) if isinstance(i.get('id'), str)}
+                    changed = body.get('changedPropIds')
+                    changed = [prop for prop in changed if prop in inputs] if isinstance(changed, list) else []
+                    trigger = ','.join(sorted(changed)) or 'initial'
+                cache = 'miss' if Cache_Use.misses else 'hit' if Cache_Use.calls else 'none'
+                payload = response.content_length
+                if payload is None:
+                    payload = len(response.get_data())
+                self.observe(name, trigger, cache, time.perf_counter()-start, payload)
+            return response
+
+        @server.route('/metrics')
+        def metrics():
+            return flask.Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def observe(self, name, trigger, cache, seconds, payload):
+        with self.lock:
+            add(self.duration, name, Duration_Buckets, seconds)
+            add(self.payload, name, Payload_Buckets, payload)
+            key = f'{name}\t{trigger}\t{cache}'
+            self.calls[key] = self.calls.get(key, 0) + 1
+            save = self.shared_dir is not None and time.monotonic()-self.saved > self.save_every
+        if seconds*1000 > self.slow_ms:
+            log.warning('slow callback %s: %.0f ms, trigger %s, %d bytes, cache %s', name, seconds*1000, trigger, payload, cache)
+        if save:
+            self.save()
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(dict(duration=self.duration, payload=self.payload, calls=self.calls)))
+
+    def save(self):
+        # written under a temporary name and renamed, so a scrape never reads half a file
+        os.makedirs(self.shared_dir, exist_ok=True)
+        path = os.path.join(self.shared_dir, f'{os.getpid()}.json')
+        temp = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp, path)
+        self.saved = time.monotonic()
+
+    def snapshots(self):
+        # counts of this process and, with shared_dir, of all other processes that saved theirs
+        if self.shared_dir is None:
+            return [self.snapshot()]
+        self.save()
+        snapshots = []
+        for name in os.listdir(self.shared_dir):
+            if name.endswith('.json'):
+                try:
+                    with open(os.path.join(self.shared_dir, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # worker replacing its file right now
+        return snapshots
+
+    def render(self):
+        duration, payload, calls = {}, {}, {}
+        for snapshot in self.snapshots():
+            for total, part in ((duration, snapshot['duration']), (payload, snapshot['payload'])):
+                for name, values in part.items():
+                    total[name] = [a+b for a, b in zip(total[name], values)] if name in total else values
+            for key, n in snapshot['calls'].items():
+                calls[key] = calls.get(key, 0) + n
+
+        lines = histogram_lines('atlas_callback_duration_seconds', 'Time to answer a callback request, JSON encoding included.',
+                                Duration_Buckets, duration)
+        lines += histogram_lines('atlas_callback_payload_bytes', 'Size of the callback response sent to the browser.',
+                                 Payload_Buckets, payload)
+        lines += ['# HELP atlas_callback_calls_total Callback requests by triggering input and cache use.',
+                  '# TYPE atlas_callback_calls_total counter']
+        for key in sorted(calls):
+            name, trigger, cache = key.split('\t')
+            lines.append(f'atlas_callback_calls_total{labels(callback=name, trigger=trigger, cache=cache)} {calls[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+def add(histogram, name, buckets, value):
+    if name not in histogram:
+        histogram[name] = [0]*(len(buckets)+1) + [0., 0]
+    values = histogram[name]
+    values[next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))] += 1
+    values[-2] += value
+    values[-1] += 1
+
+
+def histogram_lines(metric, text, buckets, histogram):
+    lines = [f'# HELP {metric} {text}', f'# TYPE {metric} histogram']
+    for name in sorted(histogram):
+        values = histogram[name]
+        cumulative = 0
+        for bound, count in zip(list(buckets)+['+Inf'], values[:-2]):
+            cumulative += count
+            lines.append(f'{metric}_bucket{labels(callback=name, le=bound)} {cumulative}')
+        lines.append(f'{metric}_sum{labels(callback=name)} {values[-2]}')
+        lines.append(f'{metric}_count{labels(callback=name)} {values[-1]}')
+    return lines
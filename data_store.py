@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+
+# Columnar store for the app data sets.
+# Every table is a folder with one .npy file per column (memory-mapped on load) and a meta.json
+# describing column names, dtypes and categories, so a worker maps the files instead of parsing CSV.
+#
+#   python data_store.py <csv folder> [<store folder>]
+#
+# converts the CSV files used by the app into the store (the store defaults to the CSV folder).
+# The test set is stored grouped by event class, so the rows of one class are a contiguous slice.
+
+META = 'meta.json'
+
+# table name in the store -> CSV file written by the notebook
+Tables = {'df_scatter':          'df_test.csv',
+          'df_shortlist':        'df_shortlist.csv',
+          'df_shortlist_scaled': 'df_shortlist_scaled.csv',
+          'df_probs':            'df_probs_2022.csv',
+          'df_metrics':          'df_metrics_2022.csv',
+          }
+
+
+def compact_dtypes(name, df):
+    # dtypes kept in the store: float32 features/weights, float32 NN scores, categorical events
+    # (shortlists and metrics are a handful of rows and keep full precision for display)
+    if name in ('df_shortlist', 'df_shortlist_scaled', 'df_metrics'):
+        return df
+    dtypes = {}
+    for column in df.columns:
+        if column == 'Event':
+            # categories in order of first appearance, the order of the events in the app
+            dtypes[column] = 'int8' if name == 'df_probs' else pd.CategoricalDtype(pd.unique(df[column]))
+        elif pd.api.types.is_float_dtype(df[column]):
+            dtypes[column] = 'float32'
+        elif pd.api.types.is_integer_dtype(df[column]):
+            dtypes[column] = 'int8' if df[column].abs().max() < 128 else 'int32'
+    return df.astype(dtypes)
+
+
+# tables whose rows are kept grouped by event class (see group_events)
+Grouped = ('df_scatter', 'df_pca', 'df_tsne', 'df_umap')
+
+
+def event_codes(df, events=None, column='Event'):
+    # int8 class code of every row, and the class names: the given events, or in order of first appearance
+    if events is None:
+        codes, events = pd.factorize(df[column], sort=False)
+    else:
+        codes = pd.Categorical(df[column], categories=events).codes
+    if (codes < 0).any():
+        raise ValueError(f'{column} has classes outside of {list(events)}')
+    return np.asarray(codes, dtype='int8'), list(events)
+
+
+def group_events(df, events=None, column='Event'):
+    # the table with the rows of every class contiguous and in the order of the classes (rows keep
+    # their order within a class), the class codes of its rows, the classes and the first row of
+    # every class: rows of class z are offsets[z]:offsets[z+1]. A grouped table is not copied.
+    codes, events = event_codes(df, events, column)
+    if (np.diff(codes) < 0).any():
+        order = np.argsort(codes, kind='stable')
+        df, codes = df.iloc[order], codes[order]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(events)))))
+    return df, codes, events, offsets
+
+
+def write_table(df, path):
+    write_columns(path, df.index, df.items())
+
+
+def write_columns(path, index, columns):
+    # columns: (name, values) pairs, written one at a time, so a table larger than memory
+    # can be written column by column from a generator
+    os.makedirs(path, exist_ok=True)
+    meta = {'index': index.name, 'columns': []}
+    index = index.to_numpy()
+    if index.dtype == object:
+        index = index.astype(str)  # plain unicode array, loads without pickle
+    np.save(os.path.join(path, 'index.npy'), index)
+    for i, (column, values) in enumerate(columns):
+        values = pd.Series(values, copy=False)
+        entry = {'name': str(column), 'file': f'c{i:04d}.npy'}
+        if not pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')  # text columns are kept as codes + categories
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            entry['categories'] = values.cat.categories.to_list()
+            values = values.cat.codes
+        np.save(os.path.join(path, entry['file']), values.to_numpy())
+        meta['columns'].append(entry)
+    with open(os.path.join(path, META), 'w') as f:
+        json.dump(meta, f, indent=1)
+
+
+# appends DataFrame chunks to a table, for tables built from sources larger than memory.
+# Columns are spooled to raw files and turned into .npy files by close(), copied in blocks, so memory
+# stays bounded by the chunk size. Dtypes follow compact_dtypes: float32 floats, integers narrowed to
+# int8/int32 once their range is known, text columns as codes of the categories given up front.
+class TableWriter:
+
+    def __init__(self, path, categories=None, index_name='index', block=1 << 22):
+        self.path = path
+        self.categories = categories or {}
+        self.index_name = index_name
+        self.block = block
+        self.columns = None   # column name -> spool dtype
+        self.rows = 0
+        # an interrupted earlier run leaves spool files, and the table is incomplete until close()
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            if name.endswith('.part') or name == META:
+                os.remove(os.path.join(path, name))
+
+    def spool(self, name):
+        return os.path.join(self.path, f'{name}.part')
+
+    def append(self, df):
+        if self.columns is None:
+            self.columns = {}
+            for column in df.columns:
+                if column in self.categories:
+                    self.columns[column] = 'int16'
+                elif pd.api.types.is_integer_dtype(df[column]) or pd.api.types.is_bool_dtype(df[column]):
+                    self.columns[column] = 'int64'
+                elif pd.api.types.is_numeric_dtype(df[column]):
+                    self.columns[column] = 'float32'
+                else:
+                    raise ValueError(f'text column {column!r} needs its categories')
+        elif list(df.columns) != list(self.columns):
+            raise ValueError(f'columns of the chunk differ from the table: {list(df.columns)}')
+        self.write('index', df.index.to_numpy(dtype='int64'))
+        for i, (column, dtype) in enumerate(self.columns.items()):
+            values = df[column]
+            if column in self.categories:
+                values = pd.Categorical(values, categories=self.categories[column]).codes
+            self.write(f'c{i:04d}', np.asarray(values, dtype=dtype))
+        self.rows += len(df)
+
+    def write(self, name, values):
+        with open(self.spool(name), 'ab') as f:
+            values.tofile(f)
+
+    def finish(self, name, dtype, final=None):
+        # spool file -> .npy, converted block by block to its final dtype
+        spool = self.spool(name)
+        source = np.memmap(spool, dtype=dtype, mode='r') if self.rows else np.empty(0, dtype=dtype)
+        if final is None:
+            lo, hi = 0, 0
+            for start in range(0, self.rows, self.block):
+                lo, hi = min(lo, source[start:start+self.block].min()), max(hi, source[start:start+self.block].max())
+            final = dtype if dtype != 'int64' else 'int8' if max(-lo, hi) < 128 else 'int32' if max(-lo, hi) < 2**31 else 'int64'
+        target = os.path.join(self.path, f'{name}.npy')
+        if self.rows:
+            out = open_memmap(target, mode='w+', dtype=final, shape=(self.rows,))
+            for start in range(0, self.rows, self.block):
+                out[start:start+self.block] = source[start:start+self.block]
+            out.flush()
+            del out, source
+        else:
+            np.save(target, source.astype(final))
+        if os.path.exists(spool):
+            os.remove(spool)
+
+    def close(self):
+        meta = {'index': self.index_name, 'columns': []}
+        self.finish('index', 'int64', 'int64')
+        for i, (column, dtype) in enumerate((self.columns or {}).items()):
+            entry = {'name': str(column), 'file': f'c{i:04d}.npy'}
+            if column in self.categories:
+                entry['categories'] = list(self.categories[column])
+                self.finish(f'c{i:04d}', dtype, 'int8' if len(entry['categories']) < 128 else 'int16')
+            else:
+                self.finish(f'c{i:04d}', dtype)
+            meta['columns'].append(entry)
+        with open(os.path.join(self.path, META), 'w') as f:
+            json.dump(meta, f, indent=1)
+
+
+def read_table(path, mmap=True):
+    # columns stay memory-mapped: pages are read on first touch and shared between processes
+    with open(os.path.join(path, META)) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+    columns = {}
+    for entry in meta['columns']:
+        values = np.load(os.path.join(path, entry['file']), mmap_mode=mode)
+        if 'categories' in entry:
+            values = pd.Categorical.from_codes(values, entry['categories'])
+        columns[entry['name']] = values
+    index = pd.Index(np.load(os.path.join(path, 'index.npy'), mmap_mode=mode), name=meta['index'])
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def in_store(data_dir, name):
+    return os.path.exists(os.path.join(data_dir, name, META))
+
+
+def file_stamp(*paths):
+    # name, size and modification time of every file: changes whenever a file is written again
+    return [[os.path.basename(path), os.path.getsize(path), os.stat(path).st_mtime_ns] for path in paths]
+
+
+def table_stamp(data_dir, name):
+    # stamp of the files a table is read from (its store folder, or the original CSV), kept with
+    # everything built from the table to tell when it has to be built again
+    if in_store(data_dir, name):
+        path = os.path.join(data_dir, name)
+        return file_stamp(*(os.path.join(path, file) for file in sorted(os.listdir(path))))
+    return file_stamp(os.path.join(data_dir, Tables[name]))
+
+
+def table_columns(data_dir, name):
+    # column names of a table, without reading its rows ([] when the table is missing)
+    if in_store(data_dir, name):
+        with open(os.path.join(data_dir, name, META)) as f:
+            return [entry['name'] for entry in json.load(f)['columns']]
+    path = os.path.join(data_dir, Tables[name])
+    return pd.read_csv(path, index_col='index', nrows=0).columns.to_list() if os.path.exists(path) else []
+
+
+def load_table(data_dir, name):
+    # read from the store if it was built, otherwise fall back to the original CSV
+    if in_store(data_dir, name):
+        return read_table(os.path.join(data_dir, name))
+    return pd.read_csv(os.path.join(data_dir, Tables[name]), index_col='index')
+
+
+def open_table(path):
+    # a table given by path: store folder or CSV file
+    if os.path.exists(os.path.join(path, META)):
+        return read_table(path)
+    return pd.read_csv(path, index_col='index')
+
+
+def convert_csv(csv_dir, store_dir=None):
+    store_dir = store_dir or csv_dir
+    for name, file in Tables.items():
+        source = os.path.join(csv_dir, file)
+        if not os.path.exists(source):
+            print(f'skip {name}: {source} not found')
+            continue
+        df = compact_dtypes(name, pd.read_csv(source, index_col='index'))
+        if name in Grouped:
+            df = group_events(df)[0]
+        write_table(df, os.path.join(store_dir, name))
+        print(f'{name}: {len(df)} rows -> {os.path.join(store_dir, name)}')
+
+
+if __name__ == '__main__':
+    convert_csv(*sys.argv[1:3])
@@ -0,0 +1,90 @@
+import os
+import json
+import numpy as np
+
+
+# Statistics of every feature of the test set, built once per data set and saved next to it
+# (feature_stats.json in the data folder, with the stamp of the table files it was built from),
+# so the sliders are set up without touching the rows:
+#   min, max     range of the feature
+#   quantiles    weighted quantiles (totalWeight) at Levels
+#   hist         weighted histogram of every event class on Hist_Bins bins between min and max
+# The rows are read in chunks, so a memory-mapped table is never loaded as a whole: one pass for the
+# ranges, one filling a fine weighted histogram per event class (Fine_Bins bins), from which the
+# display histograms are summed and the quantiles interpolated (to within (max-min)/Fine_Bins).
+
+Levels = np.round(np.concatenate(([0., 0.001, 0.005], np.arange(0.01, 1., 0.01), [0.995, 0.999, 1.])), 3)
+Hist_Bins = 64
+Fine_Bins = 1 << 14
+
+
+def chunks(values, chunk):
+    for start in range(0, len(values), chunk):
+        yield start, np.asarray(values[start:start+chunk], dtype='float64')
+
+
+def feature_stats(values, codes, weights, n_events, chunk):
+    lo, hi = np.inf, -np.inf
+    for _, x in chunks(values, chunk):
+        lo, hi = min(lo, x.min()), max(hi, x.max())
+    width = (hi - lo) or 1.
+
+    fine = np.zeros(n_events*Fine_Bins)
+    for start, x in chunks(values, chunk):
+        bins = np.clip(((x - lo) / width * Fine_Bins).astype('int64'), 0, Fine_Bins-1)
+        fine += np.bincount(codes[start:start+chunk]*Fine_Bins + bins, weights=weights[start:start+chunk],
+                            minlength=n_events*Fine_Bins)
+    fine = fine.reshape(n_events, Fine_Bins)
+
+    # cumulative weight at the upper edge of every fine bin; negative MC weights can make it dip,
+    # so it is made non-decreasing before it is inverted
+    edges = lo + width*np.arange(Fine_Bins+1)/Fine_Bins
+    cumulative = np.maximum.accumulate(np.concatenate(([0.], fine.sum(axis=0).cumsum())))
+    quantiles = np.interp(Levels*cumulative[-1], cumulative, edges)
+    quantiles[0], quantiles[-1] = lo, hi
+    return dict(min = float(lo), max = float(hi),
+                quantiles = quantiles.tolist(),
+                hist = fine.reshape(n_events, Hist_Bins, -1).sum(axis=2).tolist())
+
+
+def build_feature_stats(df, features, events, codes, weight='totalWeight', chunk=1 << 20, source=None):
+    # codes: position of the event of every row in events (see data_store.group_events),
+    # source: stamp of the files df was read from (data_store.table_stamp)
+    codes = np.asarray(codes, dtype='int64')
+    weights = df[weight].to_numpy(dtype='float64')
+    return dict(rows = len(df), events = list(events), levels = Levels.tolist(), hist_bins = Hist_Bins, source = source,
+                features = {feature: feature_stats(df[feature].to_numpy(), codes, weights, len(events), chunk)
+                            for feature in features})
+
+
+def cached_feature_stats(path, features, source, table, weight='totalWeight'):
+    # catalog read from path, or built and saved there first if missing or out of date. source is the
+    # stamp of the table files (data_store.table_stamp), so a saved catalog is checked without reading
+    # the rows; table() gives the grouped table, its codes and events (data_store.group_events) to build it
+    try:
+        with open(path) as f:
+            stats = json.load(f)
+        if list(stats['features']) == list(features) and stats['levels'] == Levels.tolist() \
+                and stats['hist_bins'] == Hist_Bins and stats.get('source') == source:
+            return stats
+    except (OSError, ValueError, KeyError):
+        pass
+    df, codes, events = table()[:3]
+    stats = build_feature_stats(df, features, events, codes, weight, source=source)
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(stats, f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass  # not saved: built again by the next process that starts
+    return stats
+
+
+def quantile(stats, feature, q):
+    # weighted quantile q (0 to 1) of a feature, interpolated between the levels of the catalog
+    return float(np.interp(q, stats['levels'], stats['features'][feature]['quantiles']))
+
+
+def hist_edges(stats, feature):
+    entry = stats['features'][feature]
+    return np.linspace(entry['min'], entry['max'], stats['hist_bins']+1)
@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+
+
+# gunicorn settings for the app:  gunicorn -c gunicorn.conf.py wsgi:server
+#
+# Data and caches are loaded once in the master (preload_app) and shared by the forked workers.
+# Callbacks are CPU bound NumPy/pandas work, so one process per core does the work and a few
+# threads per worker keep serving the quick callbacks while a slow one runs.
+
+bind = os.environ.get('ATLAS_BIND', '0.0.0.0:8050')
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('ATLAS_THREADS', 4))
+timeout = 120
+
+# with ATLAS_PRELOAD=background the master only loads the app, and each worker warms its own caches
+# after the fork (see wsgi.py)
+os.environ['ATLAS_WARM_UP_AFTER_FORK'] = '1'
+
+def post_fork(server, worker):
+    if os.environ.get('ATLAS_PRELOAD') == 'background':
+        import wsgi
+        wsgi.start_background_warm_up()
+
+# callback metrics of all workers, added up by /metrics whichever worker answers (see callback_metrics.py);
+# a folder per master, removed when it exits
+Metrics_Dir = os.environ.setdefault('ATLAS_METRICS_DIR', os.path.join(tempfile.gettempdir(), f'atlas-metrics-{os.getpid()}'))
+
+def on_exit(server):
+    shutil.rmtree(Metrics_Dir, ignore_errors=True)
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import argparse
+import pandas as pd
+from data_store import TableWriter
+
+
+# Builds the selected data set of the notebook (df_app: df_2022 after the ETmiss cut, without N_bjets)
+# from the per-process CSV files of the ATLAS open data (DM_ML_workbook), straight into the store.
+#
+#   python ingest.py <csv folder> <store folder> [--dm 300] [--chunk 500000] [--table df_2022]
+#
+# Every process file is read in chunks; each chunk gets its Event name and the selection, and is
+# appended to the table, so memory is bounded by the chunk size and not by the data set.
+# The index numbers the events of all files in order before the selection, like the notebook's
+# concatenation with ignore_index, so rows of the split and test tables can be traced back.
+
+# background processes in file name order, and their names in the app
+Processes = ['nonresll', 'Zjets', 'WZ', 'ZZ']
+Process_Names = {'nonresll': 'Non-resonant_ll', 'Zjets': 'Z+jets'}
+
+# selection of the notebook
+ETmiss_cut = 90.24
+Dropped = ['N_bjets']
+
+
+def select(df):
+    return df[df['ETmiss'] > ETmiss_cut].drop(columns=Dropped, errors='ignore')
+
+
+def process_files(csv_dir, dm_mass):
+    # (event name, file) of the backgrounds, then the signal (the app expects it last)
+    files = [(Process_Names.get(process, process), os.path.join(csv_dir, f'{process}.csv')) for process in Processes]
+    return files + [(f'DM_{dm_mass}', os.path.join(csv_dir, f'DM_{dm_mass}.csv'))]
+
+
+def ingest(csv_dir, store_dir, dm_mass=300, chunk=500_000, table='df_2022'):
+    files = process_files(csv_dir, dm_mass)
+    missing = [path for _, path in files if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f'missing process files: {missing}')
+
+    writer = TableWriter(os.path.join(store_dir, table), categories={'Event': [event for event, _ in files]})
+    offset = 0
+    for event, path in files:
+        start, read, kept = time.time(), 0, 0
+        for df in pd.read_csv(path, chunksize=chunk):
+            df.index = df.index + offset   # chunks carry on the row numbers of the file
+            df.insert(loc=0, column='Event', value=event)
+            read += len(df)
+            df = select(df)
+            kept += len(df)
+            writer.append(df)
+        offset += read
+        print(f'{event}: {kept} of {read} events selected ({time.time()-start:.1f} s)')
+    writer.close()
+    print(f'{writer.rows} of {offset} events -> {os.path.join(store_dir, table)}')
+    return writer.rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stream the per-process CSV files into the selected data set in the store.')
+    parser.add_argument('csv', help='folder with nonresll.csv, Zjets.csv, WZ.csv, ZZ.csv and DM_<mass>.csv')
+    parser.add_argument('store', help='store folder')
+    parser.add_argument('--dm', type=int, default=300, help='DM mass of the signal file (GeV)')
+    parser.add_argument('--chunk', type=int, default=500_000, help='rows read at a time')
+    parser.add_argument('--table', default='df_2022', help='name of the table in the store')
+    args = parser.parse_args(argv)
+    ingest(args.csv, args.store, args.dm, args.chunk, args.table)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
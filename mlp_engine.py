@@ -0,0 +1,85 @@
+import numpy as np
+
+
+# Trained MLPs kept as plain arrays (the coefs_/intercepts_ of each MLPClassifier) in one .npz file,
+# with a NumPy forward pass that scores one event or a whole data set for any stored design.
+#
+# Keys of the .npz file:
+#   features                 input feature names, in training order
+#   scaler/mean, scaler/scale  StandardScaler of the training set (to score unscaled features), if any
+#   <design>/W0, <design>/b0 ...   weights and biases of every layer, <design> as in df_probs: '(4, 6)'
+#   <design>/activation      hidden activation ('relu', 'logistic', 'tanh' or 'identity')
+
+ACTIVATIONS = {'relu':     lambda a: np.maximum(a, 0., out=a),
+               'logistic': lambda a: np.reciprocal(1.+np.exp(-a, out=a), out=a),
+               'tanh':     lambda a: np.tanh(a, out=a),
+               'identity': lambda a: a,
+               }
+
+
+def design_name(layers):
+    # column name of a design in df_probs/df_metrics, e.g. (4,) -> '(4,)', (4, 6) -> '(4, 6)'
+    return str(tuple(int(n) for n in layers))
+
+
+def save_weight_bank(path, models, scaler=None, features=None):
+    # models: design (tuple or name) -> fitted binary MLPClassifier
+    arrays = {}
+    if features is not None:
+        arrays['features'] = np.array(features, dtype=str)
+    if scaler is not None:
+        arrays['scaler/mean'] = np.asarray(scaler.mean_, dtype='float64')
+        arrays['scaler/scale'] = np.asarray(scaler.scale_, dtype='float64')
+    for design, model in models.items():
+        name = design if isinstance(design, str) else design_name(design)
+        for i, (W, b) in enumerate(zip(model.coefs_, model.intercepts_)):
+            arrays[f'{name}/W{i}'] = W
+            arrays[f'{name}/b{i}'] = b
+        arrays[f'{name}/activation'] = np.array(model.activation)
+    np.savez_compressed(path, **arrays)
+
+
+class WeightBank:
+
+    def __init__(self, path):
+        with np.load(path) as bank:
+            arrays = {key: bank[key] for key in bank.files}
+        self.features = arrays.pop('features').tolist() if 'features' in arrays else None
+        self.mean = arrays.pop('scaler/mean', None)
+        self.scale = arrays.pop('scaler/scale', None)
+        # design -> (activation, [(W, b) of every layer])
+        self.layers = {}
+        for key in arrays:
+            design, name = key.rsplit('/', 1)
+            if name == 'activation':
+                n = sum(1 for k in arrays if k.startswith(design+'/W'))
+                self.layers[design] = (str(arrays[key]), [(arrays[f'{design}/W{i}'], arrays[f'{design}/b{i}']) for i in range(n)])
+        self.designs = list(self.layers)
+
+    def __contains__(self, design):
+        return design in self.layers
+
+    def coefs(self, design):
+        return [W for W, b in self.layers[design][1]]
+
+    def scale_features(self, X):
+        X = np.asarray(X, dtype='float64')
+        if self.mean is None:
+            return X  # saved without a scaler: the models were trained on the features as they are
+        return (X - self.mean) / self.scale
+
+    def predict_proba(self, design, X, scaled=True, chunk=65536):
+        # signal probability of every row of X, in chunks so large sets stay within a few MB per layer
+        activation, layers = self.layers[design]
+        hidden = ACTIVATIONS[activation]
+        X = np.atleast_2d(np.asarray(X))
+        probs = np.empty(len(X), dtype='float32')
+        for start in range(0, len(X), chunk):
+            a = np.asarray(X[start:start+chunk], dtype='float64')
+            if not scaled:
+                a = self.scale_features(a)
+            for W, b in layers[:-1]:
+                a = hidden(a @ W + b)
+            W, b = layers[-1]
+            probs[start:start+chunk] = ACTIVATIONS['logistic']((a @ W + b)[:, 0])
+        return probs
@@ -0,0 +1,258 @@
+import os
+import re
+import gc
+import threading
+import itertools
+import collections
+import numpy as np
+from data_store import load_table, in_store, table_columns, table_stamp, file_stamp, group_events
+from score_index import Bkg_Tolerance, ScoreIndex, cached_score_index, cached_design_index, build_hist_cache, classification_metrics, significance_matrix, best_cuts
+from range_index import RangeIndex
+from feature_stats import cached_feature_stats
+from mlp_engine import WeightBank, design_name
+from callback_metrics import Cache_Use, cached
+
+
+# The data of one signal (DM) mass, read from one data folder: the test set with that signal (df_scatter)
+# grouped by event, its shortlist, metrics, NN outputs or weight bank, feature statistics and projections.
+#
+# The data folder of the app holds one mass (the tables themselves), or one sub-folder per mass named
+# after its signal event (DM_10, DM_300, DM_2000, ...), each laid out like a folder of one mass. Masses
+# are loaded on first use and kept in a PartitionCache of bounded size; every cache built from a mass
+# hangs off its Partition, so evicting the mass frees all of it.
+
+featX = 'ETmiss'
+
+# bins of the NN output histogram and cut values of the histogram slider
+Hist_Edges = np.linspace(0., 1., 20+1)
+Hist_Cuts = np.round(np.arange(0., 1.+0.05/2, 0.05), 2)
+# fine grid of cuts searched for the best cut of every design
+Best_Cut_Grid = np.round(np.linspace(0., 1., 1001), 3)
+
+# 2D projections of the test set written to the store by projections.py
+Projection_Names = {'pca': 'PCA', 'tsne': 't-SNE', 'umap': 'UMAP'}
+
+
+def find_partitions(data_dir):
+    # signal event -> folder of every mass, lightest first; a folder of one mass is {'': data_dir}
+    masses = {}
+    for name in (os.listdir(data_dir) if os.path.isdir(data_dir) else []):
+        match = re.fullmatch(r'DM_(\d+)', name)
+        if match and os.path.isdir(os.path.join(data_dir, name)):
+            masses[name] = int(match.group(1))
+    if not masses:
+        return {'': data_dir}
+    return {name: os.path.join(data_dir, name) for name in sorted(masses, key=masses.get)}
+
+
+# attribute of a Partition built on first access, by one thread while the others wait for it; kept in
+# the instance afterwards (so later reads do not lock, and it goes with the partition)
+class lazy:
+
+    def __init__(self, function):
+        self.function = function
+        self.name = function.__name__
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        with instance.load_lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.function(instance)
+        return instance.__dict__[self.name]
+
+
+class Partition:
+
+    def __init__(self, folder):
+        # only column names, the weight bank and what the store has are read here: the tables, the
+        # slider index and the feature statistics are read or built on first use (or by warm_up)
+        self.folder = folder
+        self.load_lock = threading.RLock()
+        self.features = [column for column in table_columns(folder, 'df_scatter') if column not in ('Event','totalWeight')]
+
+        # trained MLPs (weights of every design, see mlp_engine.py): the NN outputs of a design in the weight
+        # bank are computed on the test set, and the precomputed df_probs table is only read for the others
+        weight_bank = os.path.join(folder, 'mlp_weights.npz')
+        self.weight_bank = WeightBank(weight_bank) if os.path.exists(weight_bank) else None
+        # designs that can be shown: those of the weight bank, then those only in df_probs (a partial training
+        # run may have written some designs only, see train_designs.py)
+        bank = self.weight_bank.designs if self.weight_bank is not None else []
+        self.designs = bank + [design for design in table_columns(folder, 'df_probs')
+                               if design not in ('Event', 'Weight') and design not in bank]
+        self.layers = {design: tuple(int(n) for n in re.findall(r'\d+', design)) for design in self.designs}
+        self.projections = [method for method in Projection_Names if in_store(folder, f'df_{method}')]
+
+        # caches of this mass, filled on first use (instance attributes, so they go with the partition)
+        self.nn_lock = threading.Lock()
+        self.load_nn_outputs = cached()(self.load_nn_outputs)
+        self.design_summary = cached()(self.design_summary)
+        self.best_cut_table = cached()(self.best_cut_table)
+        self.projection = cached()(self.projection)
+
+    # rows of event z are offsets[z]:offsets[z+1], codes the event of every row as its position in events
+    @lazy
+    def scatter_table(self):
+        return group_events(load_table(self.folder, 'df_scatter'))
+
+    @lazy
+    def df_scatter(self):
+        return self.scatter_table[0]
+
+    @lazy
+    def codes(self):
+        return self.scatter_table[1]
+
+    @lazy
+    def offsets(self):
+        return self.scatter_table[3]
+
+    # min/max, weighted quantiles and per-event histograms of every feature (see feature_stats.py), read
+    # from the data folder; the events are those of the catalog, so the rows are only read to build it
+    @lazy
+    def stats(self):
+        return cached_feature_stats(os.path.join(self.folder, 'feature_stats.json'), self.features,
+                                    table_stamp(self.folder, 'df_scatter'), lambda: self.scatter_table)
+
+    @lazy
+    def events(self):
+        return self.stats['events']
+
+    @lazy
+    def signal(self):
+        return next((event for event in self.events if event.startswith('DM_')), self.events[-1])
+
+    @lazy
+    def signal_code(self):
+        return self.events.index(self.signal)
+
+    # weights of each event inside the slider window, counted without masking rows
+    @lazy
+    def scatter_index(self):
+        return RangeIndex(self.df_scatter, featX, self.events, codes=self.codes)
+
+    @lazy
+    def df_shortlist(self):
+        return load_table(self.folder, 'df_shortlist')
+
+    @lazy
+    def df_shortlist_scaled(self):
+        return load_table(self.folder, 'df_shortlist_scaled')
+
+    @lazy
+    def df_metrics(self):
+        return load_table(self.folder, 'df_metrics')
+
+    def nearest_design(self, layers):
+        # the design with these hidden layer sizes, or else the nearest one there is with as many layers
+        # (ties go to the larger sizes, so the even grid rounds odd sizes up)
+        layers = tuple(int(n) for n in layers)
+        if design_name(layers) in self.layers or not self.layers:
+            return design_name(layers)
+        designs = [design for design in self.designs if len(self.layers[design]) == len(layers)] or self.designs
+        def distance(design):
+            other = self.layers[design]
+            return sum(abs(a-b) for a, b in itertools.zip_longest(layers, other, fillvalue=0)), -sum(other)
+        return min(designs, key=distance)
+
+    # NN outputs (df_probs, score index and histogram counts of every design): read on first use, not on
+    # load, so the largest table and the slowest build stay out of the way of a mass switch
+    def load_nn_outputs(self):
+        if not table_columns(self.folder, 'df_probs'):
+            return None, {}, {}
+        df_probs = load_table(self.folder, 'df_probs')
+        # index NN outputs once: sorted scores with cumulative weights for every design, saved in the
+        # data folder and memory-mapped, so all worker processes read the same pages
+        score_index = cached_score_index(os.path.join(self.folder, 'score_index'), df_probs, table_stamp(self.folder, 'df_probs'))
+        # and bin them once: weighted counts of background/signal in 20 bins per design
+        hist_cache = build_hist_cache(score_index)[1]
+        return df_probs, score_index, hist_cache
+
+    def nn_outputs(self):
+        with self.nn_lock:  # threads of a worker wait for one load instead of each starting their own
+            return self.load_nn_outputs()
+
+    def bank_index(self, design):
+        # score the whole test set with the weight bank (the test set is df_scatter), once for all workers:
+        # saved next to the index of df_probs and memory-mapped like it
+        def build():
+            scores = self.weight_bank.predict_proba(design, self.df_scatter[self.weight_bank.features or self.features], scaled=False)
+            signal = (self.codes==self.signal_code).astype('int8')
+            weights = self.df_scatter['totalWeight'].to_numpy(dtype='float64')
+            return ScoreIndex(scores, signal, weights)
+        source = table_stamp(self.folder, 'df_scatter') + file_stamp(os.path.join(self.folder, 'mlp_weights.npz'))
+        return cached_design_index(os.path.join(self.folder, 'score_index', 'bank'), design, build, source)
+
+    # everything the callbacks show about one design, computed once per design and shared by all of them
+    def design_summary(self, design):
+        if self.weight_bank is not None and design in self.weight_bank:
+            index = self.bank_index(design)
+            counts = index.hist_counts(Hist_Edges)
+        else:
+            _, score_index, hist_cache = self.nn_outputs()
+            index, counts = score_index[design], hist_cache[design]
+        W_sig, W_bkg = index.weights_above(Hist_Cuts)
+        full_sig, full_bkg = index.totals()
+        # metrics of designs trained after df_metrics was written are computed from the scores
+        metrics = self.df_metrics[design] if design in self.df_metrics else classification_metrics(index)
+        return dict(accuracy = round(float(metrics['Accuracy']), 2),
+                    f1_score = round(float(metrics['f1-score']), 2),
+                    index = index,
+                    counts = counts,
+                    hist_data = dict(cuts = Hist_Cuts.tolist(),
+                                     sig = W_sig.tolist(), bkg = W_bkg.tolist(),
+                                     full_sig = float(full_sig), full_bkg = float(full_bkg),
+                                     bkg_tolerance = Bkg_Tolerance))
+
+    # best cut and maximum significance of all designs, from one significance matrix (designs x cuts)
+    def best_cut_table(self):
+        index = {design: self.design_summary(design)['index'] for design in self.designs}
+        return best_cuts(self.designs, Best_Cut_Grid, significance_matrix(index, Best_Cut_Grid))
+
+    def projection(self, method):
+        df, codes, _, offsets = group_events(load_table(self.folder, f'df_{method}'), self.events)
+        return dict(df = df,
+                    offsets = offsets,
+                    index = RangeIndex(df, '0', self.events, codes=codes),
+                    x_range = [float(df['0'].min()), float(df['0'].max())],
+                    y_range = [float(df['1'].min()), float(df['1'].max())])
+
+
+# the partitions in use, least recently used first: loading one more than maxsize evicts the oldest
+class PartitionCache:
+
+    def __init__(self, folders, maxsize=2):
+        self.folders = folders
+        self.maxsize = max(1, maxsize)
+        self.loaded = collections.OrderedDict()
+        self.lock = threading.Lock()   # held for lookups and bookkeeping only, never for a load
+        self.loading = {}              # mass -> lock of its load, so a mass is loaded by one thread at a time
+
+    def __contains__(self, mass):
+        return mass in self.folders
+
+    def __call__(self, mass):
+        with self.lock:
+            if mass in self.loaded:
+                self.loaded.move_to_end(mass)
+                return self.loaded[mass]
+            loading = self.loading.setdefault(mass, threading.Lock())
+        # threads asking for this mass wait for one load; those asking for loaded masses go on meanwhile
+        with loading:
+            with self.lock:
+                if mass in self.loaded:   # loaded by the thread waited for
+                    self.loaded.move_to_end(mass)
+                    return self.loaded[mass]
+            # only loads are counted on /metrics (as a call that missed): every callback looks its mass up,
+            # so counting those lookups would mark nearly every request as a cache hit
+            Cache_Use.calls += 1
+            Cache_Use.misses += 1
+            partition = Partition(self.folders[mass])
+            with self.lock:
+                self.loaded[mass] = partition
+                evicted = [self.loaded.popitem(last=False) for _ in range(len(self.loaded)-self.maxsize)]
+                del self.loading[mass]
+        if evicted:
+            del evicted
+            gc.collect()   # the caches of a partition refer back to it: free the evicted ones now
+        return partition
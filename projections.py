@@ -0,0 +1,112 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from data_store import load_table, write_columns
+
+
+# 2D projections of the test set (df_scatter) for the projection tab of the app, written to the store
+# as df_pca, df_tsne and df_umap: columns Event, totalWeight, '0' and '1' as in the notebook tables.
+#
+#   python projections.py <data folder> [--methods pca tsne umap] [--chunk 200000] [--sample 20000]
+#
+# PCA streams over the memory-mapped store in chunks (StandardScaler and IncrementalPCA partial_fit,
+# then transform), so it covers every event of data sets larger than memory. t-SNE and UMAP have no
+# streaming fit: they embed a sample stratified by class, whose weights are scaled up to the total
+# weight of each class, so the sidebar of the tab still shows the weights of the whole data set.
+
+seed = 84
+Methods = ['pca', 'tsne', 'umap']
+
+
+def feature_chunks(df, features, chunk):
+    # rows start:start+chunk of every feature, sliced column by column from the memory-mapped arrays,
+    # so only the chunk is read and copied
+    columns = [df[feature].to_numpy() for feature in features]
+    for start in range(0, len(df), chunk):
+        yield np.column_stack([values[start:start+chunk] for values in columns]).astype('float64', copy=False)
+
+
+def fit_scaler(df, features, chunk):
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler()
+    for X in feature_chunks(df, features, chunk):
+        scaler.partial_fit(X)
+    return scaler
+
+
+def pca_projection(df, features, scaler, chunk):
+    from sklearn.decomposition import IncrementalPCA
+    pca = IncrementalPCA(n_components=2, whiten=True, batch_size=chunk)
+    for X in feature_chunks(df, features, chunk):
+        if len(X) >= 2:   # a last chunk of one row cannot be fitted, it is still transformed below
+            pca.partial_fit(scaler.transform(X))
+    projection = np.empty((len(df), 2), dtype='float32')
+    for i, X in enumerate(feature_chunks(df, features, chunk)):
+        projection[i*chunk:i*chunk+len(X)] = pca.transform(scaler.transform(X))
+    print(f"pca: {pca.explained_variance_ratio_.sum()*100:.1f}% of the variance in 2 components")
+    return np.arange(len(df)), projection
+
+
+def stratified_sample(df, size, rng):
+    # rows of a sample with the class shares of the data set, and the weight factor of each row
+    codes = pd.Categorical(df['Event']).codes
+    if size >= len(df):
+        return np.arange(len(df)), np.ones(len(df))
+    rows = []
+    for code in np.unique(codes):
+        members = np.flatnonzero(codes == code)
+        rows.append(rng.choice(members, max(1, round(size*len(members)/len(df))), replace=False))
+    rows = np.sort(np.concatenate(rows))
+    weights = df['totalWeight'].to_numpy(dtype='float64')
+    factor = np.bincount(codes, weights=weights) / np.bincount(codes[rows], weights=weights[rows], minlength=codes.max()+1)
+    return rows, factor[codes[rows]]
+
+
+def sample_projection(method, df, features, scaler, size, rng):
+    rows, factor = stratified_sample(df, size, rng)
+    X = scaler.transform(df[features].iloc[rows].to_numpy(dtype='float64'))
+    if method == 'tsne':
+        from sklearn.manifold import TSNE
+        model = TSNE(n_components=2, learning_rate='auto', init='random', perplexity=30, random_state=seed)
+    else:
+        from umap import UMAP
+        model = UMAP(n_components=2, init='random', random_state=seed)
+    return rows, model.fit_transform(X).astype('float32'), factor
+
+
+def write_projection(store_dir, method, df, rows, projection, factor=None):
+    weights = df['totalWeight'].to_numpy(dtype='float64')[rows]
+    if factor is not None:
+        weights = weights*factor
+    columns = [('Event', df['Event'].iloc[rows]), ('totalWeight', weights.astype('float32')),
+               ('0', projection[:, 0]), ('1', projection[:, 1])]
+    write_columns(os.path.join(store_dir, f'df_{method}'), df.index[rows], columns)
+    print(f'df_{method}: {len(rows)} events -> {os.path.join(store_dir, f"df_{method}")}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute the 2D projections of the test set shown by the app.')
+    parser.add_argument('data', help='data folder of the app (ATLAS_DATA_DIR), the projections are written to its store')
+    parser.add_argument('--methods', nargs='+', choices=Methods, default=Methods)
+    parser.add_argument('--chunk', type=int, default=200_000, help='rows per PCA chunk')
+    parser.add_argument('--sample', type=int, default=20_000, help='events embedded by t-SNE and UMAP')
+    args = parser.parse_args(argv)
+
+    df = load_table(args.data, 'df_scatter')
+    features = df.drop(columns=['Event','totalWeight']).columns.to_list()
+    scaler = fit_scaler(df, features, args.chunk)
+    rng = np.random.default_rng(seed)
+    for method in args.methods:
+        if method == 'pca':
+            write_projection(args.data, method, df, *pca_projection(df, features, scaler, args.chunk))
+            continue
+        try:
+            write_projection(args.data, method, df, *sample_projection(method, df, features, scaler, args.sample, rng))
+        except ImportError as error:
+            print(f'skip {method}: {error}')   # UMAP needs the umap-learn package
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+
+# Weighted event counts inside an axis-aligned rectangle of the scatter plot, without masking rows.
+# X (ETmiss) and every Y feature are cut into quantile bins. Cells fully inside the rectangle are
+# summed from a per-event 2D prefix-sum grid; only rows in the boundary bins are checked exactly.
+# Rows are kept grouped by X bin (shared by all features) and by Y bin (per feature), so each
+# boundary strip is a contiguous slice of row numbers.
+class RangeIndex:
+
+    def __init__(self, df, featX, events, bins=256, weight='totalWeight', codes=None):
+        self.df = df
+        self.bins = bins
+        # class of every row as its position in events (given when the caller has them already)
+        codes = pd.Categorical(df['Event'], categories=events).codes if codes is None else codes
+        self.codes = np.asarray(codes, dtype='int64')
+        self.weights = df[weight].to_numpy(dtype='float64')
+        self.n_events = len(events)
+        # total weight of each event, the '(full)' numbers of the sidebar
+        self.totals = np.bincount(self.codes, weights=self.weights, minlength=self.n_events)
+
+        self.x = df[featX].to_numpy()
+        self.x_edges, self.cx = quantile_bins(self.x, bins)
+        self.x_rows, self.x_offsets = group_rows(self.cx, len(self.x_edges)-1)
+        self.features = {}   # Y feature -> its bins, row groups and prefix sums, built on first use
+
+    def feature(self, featY):
+        if featY not in self.features:
+            y = self.df[featY].to_numpy()
+            y_edges, cy = quantile_bins(y, self.bins)
+            nx, ny = len(self.x_edges)-1, len(y_edges)-1
+            cells = np.bincount((self.codes*nx + self.cx)*ny + cy, weights=self.weights,
+                                minlength=self.n_events*nx*ny).reshape(self.n_events, nx, ny)
+            # prefix[e, i, j] = weight of event e in x bins < i and y bins < j
+            prefix = np.zeros((self.n_events, nx+1, ny+1))
+            prefix[:, 1:, 1:] = cells.cumsum(axis=1).cumsum(axis=2)
+            y_rows, y_offsets = group_rows(cy, ny)
+            self.features[featY] = (y, y_edges, y_rows, y_offsets, prefix)
+        return self.features[featY]
+
+    def weights_in(self, featY, x_range, y_range):
+        # weight of every event with x_range[0] <= X <= x_range[1] and y_range[0] <= Y <= y_range[1]
+        y, y_edges, y_rows, y_offsets, prefix = self.feature(featY)
+        (Xlow, Xhigh), (Ylow, Yhigh) = x_range, y_range
+        xa, xb = find_bin(self.x_edges, Xlow), find_bin(self.x_edges, Xhigh)
+        ya, yb = find_bin(y_edges, Ylow), find_bin(y_edges, Yhigh)
+
+        # cells strictly between the boundary bins
+        W = np.zeros(self.n_events)
+        if xb > xa+1 and yb > ya+1:
+            W += prefix[:, xb, yb] - prefix[:, xa+1, yb] - prefix[:, xb, ya+1] + prefix[:, xa+1, ya+1]
+
+        # boundary X bins, any Y
+        rows = np.concatenate([self.x_rows[self.x_offsets[k]:self.x_offsets[k+1]] for k in {xa, xb}])
+        inside = (self.x[rows] >= Xlow) & (self.x[rows] <= Xhigh) & (y[rows] >= Ylow) & (y[rows] <= Yhigh)
+        W += np.bincount(self.codes[rows[inside]], weights=self.weights[rows[inside]], minlength=self.n_events)
+
+        # boundary Y bins, inner X bins only (X is then inside the range by construction)
+        rows = np.concatenate([y_rows[y_offsets[k]:y_offsets[k+1]] for k in {ya, yb}])
+        inside = (self.cx[rows] > xa) & (self.cx[rows] < xb) & (y[rows] >= Ylow) & (y[rows] <= Yhigh)
+        W += np.bincount(self.codes[rows[inside]], weights=self.weights[rows[inside]], minlength=self.n_events)
+        return W
+
+
+def quantile_bins(values, bins):
+    # bin edges at quantiles (so every boundary strip holds about N/bins rows) and the bin of each value
+    edges = np.unique(np.quantile(values, np.linspace(0., 1., bins+1)))
+    if len(edges) < 2:
+        edges = np.array([edges[0], edges[0]+1.])
+    index = np.clip(np.searchsorted(edges, values, side='right')-1, 0, len(edges)-2)
+    return edges, index.astype('int16' if len(edges) < 2**15 else 'int32')
+
+
+def group_rows(index, n_bins):
+    # row numbers ordered by bin, with the start of every bin
+    rows = np.argsort(index, kind='stable').astype('int32' if len(index) < 2**31 else 'int64')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(index, minlength=n_bins))))
+    return rows, offsets
+
+
+def find_bin(edges, value):
+    return int(np.clip(np.searchsorted(edges, value, side='right')-1, 0, len(edges)-2))
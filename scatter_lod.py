@@ -0,0 +1,32 @@
+import numpy as np
+
+
+# Level of detail for the scatter plot.
+# Above max_points the window is cut into a bins x bins grid and one point is drawn per event
+# class and grid cell, carrying the summed weight of the cell, so thin structures and outliers
+# survive while dense regions collapse. While the occupied cells are still too many the grid is
+# coarsened (a quarter fewer bins per step), so every row's weight stays on a drawn point and no
+# cell is dropped.
+def thin_points(x, y, codes, weights, x_range, y_range, max_points=20000, bins=256):
+    n = len(x)
+    if n <= max_points:
+        return np.arange(n), np.asarray(weights, dtype='float64')
+
+    (x0, x1), (y0, y1) = x_range, y_range
+    ix = np.clip(((x - x0) / ((x1 - x0) or 1) * bins).astype('int64'), 0, bins - 1)
+    iy = np.clip(((y - y0) / ((y1 - y0) or 1) * bins).astype('int64'), 0, bins - 1)
+    codes = np.asarray(codes, dtype='int64')
+    n_codes = int(codes.max()) + 1
+
+    # occupied cells are counted with bincount, the rows are only sorted once the grid is chosen;
+    # a coarser grid of b bins is taken from the bin numbers of the finest one
+    b = bins
+    cell = (codes * b + ix) * b + iy
+    while b > 1 and np.count_nonzero(np.bincount(cell, minlength=n_codes*b*b)) > max_points:
+        b = b * 3 // 4
+        cell = (codes * b + ix * b // bins) * b + iy * b // bins
+
+    _, keep, inverse = np.unique(cell, return_index=True, return_inverse=True)
+    cell_weight = np.bincount(inverse, weights=np.asarray(weights, dtype='float64'))
+    order = np.argsort(keep)
+    return keep[order], cell_weight[order]
@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import numpy as np
+import pandas as pd
+from numpy.lib.format import open_memmap
+
+
+# background weight above a cut below this fraction of the total weight counts as none left
+Bkg_Tolerance = 1e-9
+
+
+# NN outputs of one design sorted once, with running sums of signal and total weight.
+# Any cut is then a binary search plus two lookups instead of a pass over all events.
+class ScoreIndex:
+
+    def __init__(self, scores, labels, weights):
+        scores = np.asarray(scores)
+        if not np.issubdtype(scores.dtype, np.floating):
+            scores = scores.astype('float64')  # float32 scores stay float32 (half the memory)
+        order = np.argsort(scores, kind='stable')
+        weights = np.asarray(weights, dtype='float64')[order]
+        signal = np.asarray(labels)[order] == 1
+
+        self.scores = scores[order]
+        # cum_*[i] holds the weight of the i lowest scores, so cum_*[0] = 0
+        self.cum_sig = np.concatenate(([0.], np.cumsum(np.where(signal, weights, 0.))))
+        self.cum_all = np.concatenate(([0.], np.cumsum(weights)))
+
+    @classmethod
+    def from_arrays(cls, scores, cum_sig, cum_all):
+        # index over existing arrays, e.g. read-only views of the memory-mapped files of save_score_index
+        index = cls.__new__(cls)
+        index.scores, index.cum_sig, index.cum_all = scores, cum_sig, cum_all
+        return index
+
+    def totals(self):
+        W_sig = self.cum_sig[-1]
+        W_bkg = self.cum_all[-1] - W_sig
+        return W_sig, W_bkg
+
+    def weights_above(self, cut):
+        # events with score >= cut, same as the mask df[design]>=cut; the cut is compared in the dtype of
+        # the scores (a float64 cut would make searchsorted cast a float32 array to float64 on every call)
+        i = np.searchsorted(self.scores, np.asarray(cut, dtype=self.scores.dtype), side='left')
+        W_sig = self.cum_sig[-1] - self.cum_sig[i]
+        W_bkg = (self.cum_all[-1] - self.cum_all[i]) - W_sig
+        # above the last background event the difference of the running sums is round-off (~1e-12),
+        # not background: it is set to 0, so it does not make a huge significance
+        W_bkg = np.where(np.abs(W_bkg) > Bkg_Tolerance*np.abs(self.cum_all[-1]), W_bkg, 0.)[()]
+        return W_sig, W_bkg
+
+    def significance(self, cut):
+        # nan where no background is left above the cut
+        W_sig, W_bkg = self.weights_above(cut)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(W_bkg > 0, W_sig/np.sqrt(np.abs(W_bkg)), np.nan)[()]
+
+    def hist_counts(self, edges):
+        # weighted counts of background (0) and signal (1) in the bins, as np.histogram counts them
+        # (left edge included, right edge only in the last bin)
+        i = np.searchsorted(self.scores, edges, side='left')
+        i[-1] = np.searchsorted(self.scores, edges[-1], side='right')
+        sig = np.diff(self.cum_sig[i])
+        return {0: np.diff(self.cum_all[i]) - sig, 1: sig}
+
+
+def design_scorer(df_probs, label='Event', weight='Weight'):
+    # index of one design column of the df_probs table, built on call
+    labels = df_probs[label].to_numpy()
+    weights = df_probs[weight].to_numpy()
+    return lambda design: ScoreIndex(df_probs[design].to_numpy(), labels, weights)
+
+
+def build_score_index(df_probs, label='Event', weight='Weight'):
+    # one index per design column of the df_probs table
+    build = design_scorer(df_probs, label, weight)
+    return {design: build(design) for design in df_probs.columns.drop([label, weight])}
+
+
+def significance_matrix(score_index, cuts):
+    # significance of every design (rows) at every cut (columns) from the cumulative weights,
+    # nan where no background is left above the cut (see weights_above)
+    cuts = np.asarray(cuts, dtype='float64')
+    W_sig = np.empty((len(score_index), len(cuts)))
+    W_bkg = np.empty((len(score_index), len(cuts)))
+    for i, index in enumerate(score_index.values()):
+        W_sig[i], W_bkg[i] = index.weights_above(cuts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(W_bkg > 0, W_sig/np.sqrt(np.abs(W_bkg)), np.nan)
+
+
+def best_cuts(designs, cuts, S):
+    # cut with the highest significance of every design, in the order of the designs
+    best = np.nanargmax(np.where(np.isnan(S).all(axis=1, keepdims=True), 0., S), axis=1)
+    return pd.DataFrame({'cut': np.asarray(cuts)[best], 'significance': S[np.arange(len(S)), best]},
+                        index=pd.Index(designs, name='design'))
+
+
+def build_hist_cache(score_index, bins=20):
+    # weighted counts of background (0) and signal (1) in equal bins over [0, 1] for every design
+    edges = np.linspace(0., 1., bins+1)
+    return edges, {design: index.hist_counts(edges) for design, index in score_index.items()}
+
+
+def save_score_index(score_index, path, source=None):
+    write_score_index(list(score_index), score_index.__getitem__, path, source)
+
+
+def write_score_index(designs, build, path, source=None):
+    # arrays of all designs stacked in three .npy files (one row per design). build(design) gives the
+    # index of one design, written to its rows and dropped before the next one is built, so a single
+    # design is held in memory however many there are. Every file is written under a temporary name
+    # and renamed, so processes that still map the old files keep reading them; meta.json, with the
+    # stamp of the source table, comes last.
+    os.makedirs(path, exist_ok=True)
+    names = ('scores', 'cum_sig', 'cum_all')
+    targets = {name: os.path.join(path, name+'.npy') for name in names}
+    # per process: workers may save the same index at once
+    temporaries = {name: f'{target}.{os.getpid()}.tmp' for name, target in targets.items()}
+    stacks = {}
+    for i, design in enumerate(designs):
+        index = build(design)
+        for name in names:
+            array = getattr(index, name)
+            if name not in stacks:
+                stacks[name] = open_memmap(temporaries[name], mode='w+', dtype=array.dtype, shape=(len(designs), len(array)))
+            stacks[name][i] = array
+        del index, array
+    rows = stacks['scores'].shape[1]
+    for name in names:
+        stacks[name].flush()
+    del stacks
+    for name in names:
+        os.replace(temporaries[name], targets[name])
+    temporary = os.path.join(path, f'meta.json.{os.getpid()}.tmp')
+    with open(temporary, 'w') as f:
+        json.dump({'designs': list(designs), 'rows': rows, 'source': source}, f)
+    os.replace(temporary, os.path.join(path, 'meta.json'))
+
+
+def load_score_index(path):
+    # memory-mapped and read-only: every process reading the files shares the same pages
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = [np.load(os.path.join(path, name+'.npy'), mmap_mode='r') for name in ('scores', 'cum_sig', 'cum_all')]
+    return {design: ScoreIndex.from_arrays(*(array[i] for array in arrays)) for i, design in enumerate(meta['designs'])}
+
+
+def cached_score_index(path, df_probs, source=None, label='Event', weight='Weight'):
+    # score index of df_probs read from path, built and saved there first if missing or out of date:
+    # source is the stamp of the files df_probs was read from (data_store.table_stamp)
+    designs = df_probs.columns.drop([label, weight]).to_list()
+    if not designs:
+        return {}   # no design trained yet (e.g. a partial training run): nothing to index or save
+    try:
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['designs'] == designs and meta['rows'] == len(df_probs) and meta.get('source') == source:
+            return load_score_index(path)
+    except (OSError, ValueError, KeyError):
+        pass
+    # built and written one design at a time, then mapped like an index saved before
+    try:
+        write_score_index(designs, design_scorer(df_probs, label, weight), path, source)
+    except OSError:
+        return build_score_index(df_probs, label, weight)  # the folder cannot be written: the index stays in this process
+    return load_score_index(path)
+
+
+def cached_design_index(path, design, build, source=None):
+    # index of one design kept in its own folder under path, e.g. path/4-6 for '(4, 6)': read from there,
+    # or built with build() and saved there first if missing or out of date (source as for cached_score_index).
+    # For designs scored on demand (weight bank), so every worker maps the index the first one built.
+    folder = os.path.join(path, '-'.join(re.findall(r'\d+', design)))
+    try:
+        with open(os.path.join(folder, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['designs'] == [design] and meta.get('source') == source:
+            return load_score_index(folder)[design]
+    except (OSError, ValueError, KeyError):
+        pass
+    index = build()
+    try:
+        save_score_index({design: index}, folder, source)
+    except OSError:
+        return index  # the folder cannot be written: the index stays in this process
+    return load_score_index(folder)[design]
+
+
+def classification_metrics(index, threshold=0.5):
+    # weighted metrics of predicting signal for scores above the threshold, in % as in df_metrics
+    W_sig, W_bkg = index.totals()
+    # predict_proba > 0.5 is a signal: the next score above the threshold in the dtype of the scores
+    # (a float64 one would round back to the threshold in float32)
+    dtype = index.scores.dtype.type
+    tp, fp = index.weights_above(np.nextafter(dtype(threshold), dtype(1)))
+    fn, tn = W_sig - tp, W_bkg - fp
+    return {'Accuracy':  round((tp+tn)/(W_sig+W_bkg)*100, 2),
+            'Precision': round(tp/(tp+fp)*100, 2) if tp+fp > 0 else 0.,
+            'Recall':    round(tp/W_sig*100, 2) if W_sig > 0 else 0.,
+            'f1-score':  round(2*tp/(2*tp+fp+fn)*100, 2) if tp > 0 else 0.,
+            'S':         round(tp/np.sqrt(fp), 2) if fp > 0 else 0.,
+            }
@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from data_store import open_table, write_columns, compact_dtypes, event_codes
+
+
+# Train/test splits of the selected data set, as in the notebook, computed on row numbers only.
+# Rows are grouped by class once (a stable argsort of the class codes) and sampled per class with a
+# seeded numpy Generator; the splits are returned as sorted arrays of row positions, so nothing is
+# copied until a table is written (and a memory-mapped table is then read in order).
+#
+#   python splits.py <selected table> <store folder> [--method balanced_count] [--fraction 0.7] [--dm 300] [--seed 84]
+#
+# writes df_train and the test set as df_scatter (the table the app shows), with df_shortlist and
+# df_shortlist_scaled; train_designs.py then takes <store>/df_train and <store>/df_scatter.
+#
+# Methods (signal: the training fraction of its events; background: per class, from N_sig = signal
+# events in training):
+#   balanced_count  4 * N_sig * (class events / background events)      fraction 0.7
+#   hybrid          4 * N_sig * (class weight / background weight)       fraction 0.8
+#   equal_weight    N_sig                                                fraction 0.7
+# The test set keeps the proportions of the selection: (1 - fraction) of the events of every background
+# class, drawn from the rows not used for training, and all remaining signal events.
+# Sizes larger than what a class has left are capped.
+
+seed = 84
+Signal = 'DM_300'
+
+Methods = {'balanced_count': 0.7, 'hybrid': 0.8, 'equal_weight': 0.7}
+
+
+def class_rows(events):
+    # class names, and the row numbers of every class as slices of one array
+    events = pd.Series(events, copy=False)
+    if isinstance(events.dtype, pd.CategoricalDtype):
+        codes, names = events.cat.codes.to_numpy(), events.cat.categories
+    else:
+        codes, names = pd.factorize(events, sort=False)
+    rows = np.argsort(codes, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(names)))))
+    return list(names), [rows[offsets[k]:offsets[k+1]] for k in range(len(names))]
+
+
+def sample(rng, rows, n):
+    return rng.choice(rows, min(int(n), len(rows)), replace=False)
+
+
+def stratified_split(events, weights=None, method='balanced_count', fraction=None, signal=Signal, seed=seed):
+    # (train, test) sorted row positions of the events (an array of class names, e.g. df['Event'])
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    fraction = Methods[method] if fraction is None else fraction
+    names, groups = class_rows(events)
+    if signal not in names:
+        raise ValueError(f'no {signal} events to split')
+    sig = names.index(signal)
+    background = [k for k in range(len(names)) if k != sig]
+
+    train = {sig: sample(rng, groups[sig], len(groups[sig])*fraction)}
+    n_sig = len(train[sig])
+    if method == 'balanced_count':
+        share = np.array([len(groups[k]) for k in background], dtype='float64')
+    elif method == 'hybrid':
+        weights = np.asarray(weights, dtype='float64')
+        share = np.array([weights[groups[k]].sum() for k in background])
+    elif method == 'equal_weight':
+        share = None
+    else:
+        raise ValueError(f'unknown split method {method!r}, one of {list(Methods)}')
+    for i, k in enumerate(background):
+        train[k] = sample(rng, groups[k], n_sig if share is None else n_sig*share[i]/share.sum()*4)
+
+    used = np.zeros(len(events), dtype=bool)
+    for rows in train.values():
+        used[rows] = True
+    test = [groups[sig][~used[groups[sig]]]]
+    for k in background:
+        test.append(sample(rng, groups[k][~used[groups[k]]], len(groups[k])*(1-fraction)))
+    return np.sort(np.concatenate(list(train.values()))), np.sort(np.concatenate(test))
+
+
+def shortlist(events, n=3, seed=0):
+    # sorted row positions of n random events of every class (the dropdown sample of the app)
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    names, groups = class_rows(events)
+    return np.sort(np.concatenate([sample(rng, rows, n) for rows in groups]))
+
+
+def write_rows(df, rows, path):
+    # the given rows of a table, one column at a time, in the dtypes of the store (data_store.compact_dtypes)
+    write_columns(path, df.index[rows], ((column, compact_dtypes('df_scatter', df[[column]].iloc[rows])[column])
+                                         for column in df.columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Split the selected data set into the training and test tables.')
+    parser.add_argument('table', help='selected data set (store folder, e.g. from ingest.py, or CSV file)')
+    parser.add_argument('store', help='store folder for df_train, df_scatter, df_shortlist and df_shortlist_scaled')
+    parser.add_argument('--method', choices=list(Methods), default='balanced_count')
+    parser.add_argument('--fraction', type=float, help='signal fraction used for training (default: per method)')
+    parser.add_argument('--dm', type=int, default=300, help='DM mass of the signal event (GeV)')
+    parser.add_argument('--seed', type=int, default=seed)
+    args = parser.parse_args(argv)
+
+    start = time.time()
+    # the table stays memory-mapped: only the class codes and weights are read, and the rows of each split
+    df = open_table(args.table)
+    codes = event_codes(df)[0]
+    train, test = stratified_split(df['Event'], df['totalWeight'].to_numpy(), args.method, args.fraction,
+                                   signal=f'DM_{args.dm}', seed=args.seed)
+    print(f'{args.method}: {len(train)} training and {len(test)} test events of {len(df)} ({time.time()-start:.1f} s)')
+    # the tables are written grouped by event, as the app keeps df_scatter (see data_store.group_events)
+    train, test = (rows[np.argsort(codes[rows], kind='stable')] for rows in (train, test))
+    write_rows(df, train, os.path.join(args.store, 'df_train'))
+    write_rows(df, test, os.path.join(args.store, 'df_scatter'))
+
+    # shortlist of the test set, and its features scaled with the training set statistics (StandardScaler)
+    short = test[shortlist(df['Event'].iloc[test])]
+    features = [column for column in df.columns if column not in ('Event','totalWeight')]
+    scaled = {}
+    for i, feature in enumerate(features):
+        X = df[feature].to_numpy()
+        if X.dtype.kind == 'f':
+            X = X.astype('float32', copy=False)   # the values as written to df_train (compact_dtypes)
+        X_train = X[train].astype('float64')
+        mean, scale = X_train.mean(), X_train.std()
+        scaled[str(i)] = (X[short].astype('float64')-mean)/(scale or 1.)
+    write_rows(df, short, os.path.join(args.store, 'df_shortlist'))
+    write_columns(os.path.join(args.store, 'df_shortlist_scaled'), df.index[short], scaled.items())
+    print(f'df_train, df_scatter, df_shortlist and df_shortlist_scaled -> {args.store}')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
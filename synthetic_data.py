@@ -0,0 +1,183 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from data_store import write_table, write_columns
+from train_designs import Designs, Designs3
+from mlp_engine import design_name
+
+
+# Synthetic ATLAS-like data sets for running the app, benchmarks and load tests without the open data.
+# Writes df_scatter, df_shortlist, df_shortlist_scaled, df_probs and df_metrics to the columnar store
+# (data_store.py) with the columns and dtypes the app reads, for any number of events and designs:
+#
+#   python synthetic_data.py <store folder> [--events 300000] [--designs 155] [--seed 84] [--dm 300 [500 ...]]
+#
+# With several DM masses every mass gets its own sub-folder DM_<mass> of the store folder (see partitions.py).
+#
+# Every class gets its own shape of the features after the ETmiss > 90 GeV selection: the Z-peaked
+# processes (Z+jets, WZ, ZZ and the DM signal, where the leptons come from a Z) have mll around 91 GeV,
+# the signal has a harder ETmiss that is back to back with the dilepton, and Z+jets has little real
+# ETmiss. NN outputs are drawn around a discriminant of those features, better separated for larger
+# designs, and the metrics are computed from them as in the notebook.
+
+Features = ['sum_lep_charge', 'lead_lep_pt', 'sublead_lep_pt', 'mll', 'ETmiss', 'dRll',
+            'dphi_pTll_ETmiss', 'fractional_pT_difference', 'ETmiss_over_HT']
+Signal = 'DM_300'
+Z_mass = 91.19
+ETmiss_cut = 90.24
+
+# per class: share of the events, median event weight, fraction of Z-peaked mll, ETmiss tail (GeV),
+# lepton pT scale (GeV), dRll mean/std, dphi(pTll, ETmiss) Beta parameters, fractional pT difference
+# scale, and hadronic activity (GeV) entering HT
+Classes = {'Non-resonant_ll': dict(share=0.25, weight=0.1,    z_peak=0.1, met=35.,  pt=45., dRll=(2.6, 0.7),
+                                   dphi=(1.5, 1.5), frac=0.6,  jets=60.),
+           'Z+jets':          dict(share=0.15, weight=0.2,    z_peak=1.0, met=12.,  pt=40., dRll=(2.4, 0.8),
+                                   dphi=(1.2, 1.8), frac=1.0,  jets=120.),
+           'WZ':              dict(share=0.25, weight=0.0005, z_peak=1.0, met=45.,  pt=55., dRll=(1.8, 0.8),
+                                   dphi=(2.0, 1.2), frac=0.3,  jets=40.),
+           'ZZ':              dict(share=0.25, weight=0.002,  z_peak=0.9, met=55.,  pt=60., dRll=(1.6, 0.7),
+                                   dphi=(3.0, 1.0), frac=0.2,  jets=30.),
+           Signal:            dict(share=0.10, weight=0.08,   z_peak=1.0, met=120., pt=70., dRll=(1.3, 0.5),
+                                   dphi=(5.0, 1.0), frac=0.12, jets=20.),
+           }
+
+Metrics = ['Accuracy', 'Precision', 'Recall', 'f1-score', 'S']
+
+
+def class_features(rng, n, spec):
+    ETmiss = ETmiss_cut + rng.exponential(spec['met'], n)
+    lead = 25. + rng.gamma(2., spec['pt']/2., n)
+    sublead = 20. + (lead-20.)*rng.beta(2., 1.5, n)
+    peaked = rng.random(n) < spec['z_peak']
+    mll = np.where(peaked, rng.normal(Z_mass, 3.5, n), 20.+rng.gamma(2., 60., n))
+    HT = lead + sublead + rng.exponential(spec['jets'], n)
+    return {'sum_lep_charge': np.zeros(n, dtype='int8'),  # opposite-sign pairs only
+            'lead_lep_pt': lead,
+            'sublead_lep_pt': sublead,
+            'mll': np.abs(mll),
+            'ETmiss': ETmiss,
+            'dRll': np.clip(rng.normal(*spec['dRll'], n), 0.3, 5.),
+            'dphi_pTll_ETmiss': np.pi*rng.beta(*spec['dphi'], n),
+            'fractional_pT_difference': rng.exponential(spec['frac'], n),
+            'ETmiss_over_HT': ETmiss/(ETmiss+HT),
+            }
+
+
+def mass_classes(mass):
+    # the classes with the signal of another DM mass: ETmiss and lepton pT scale with the mass
+    scale = mass/300.
+    classes = {event: spec for event, spec in Classes.items() if event != Signal}
+    classes[f'DM_{mass}'] = dict(Classes[Signal], met=Classes[Signal]['met']*scale, pt=Classes[Signal]['pt']*scale**0.5)
+    return classes
+
+
+def make_scatter(n, rng, classes=Classes):
+    # test set grouped by class (the app shows the classes in this order, signal last)
+    counts = np.floor(np.array([spec['share'] for spec in classes.values()])*n).astype(int)
+    counts[0] += n - counts.sum()
+    parts = [class_features(rng, count, spec) for count, spec in zip(counts, classes.values())]
+    df = pd.DataFrame({'Event': pd.Categorical.from_codes(np.repeat(np.arange(len(classes)), counts), list(classes)),
+                       'totalWeight': np.concatenate([rng.lognormal(np.log(spec['weight']), 0.5, count)
+                                                      for count, spec in zip(counts, classes.values())]).astype('float32')},
+                      index=pd.Index(np.arange(n), name='index'))
+    for feature in Features:
+        values = np.concatenate([part[feature] for part in parts])
+        df[feature] = values if feature == 'sum_lep_charge' else values.astype('float32')
+    return df
+
+
+def discriminant(df):
+    # signal-like score of every event from its features, standardised
+    z = (2.*(df['ETmiss_over_HT'].to_numpy('float64')-0.45)/0.15
+         + 1.5*np.log1p(df['ETmiss'].to_numpy('float64')-ETmiss_cut)
+         + 1.0*np.cos(np.pi-df['dphi_pTll_ETmiss'].to_numpy('float64'))
+         - 1.0*np.log1p(df['fractional_pT_difference'].to_numpy('float64'))
+         - 0.05*np.abs(df['mll'].to_numpy('float64')-Z_mass))
+    return (z-z.mean())/z.std()
+
+
+def design_probs(design, z, signal, seed):
+    # NN output of one design: sharper and less noisy the more neurons it has
+    rng = np.random.default_rng([seed, *design])
+    capacity = 1.-np.exp(-sum(design)*len(design)**0.5/25.)
+    logit = (1.5+2.*capacity)*z + 1.5*(2*signal-1)*capacity + rng.normal(0., 1.3-0.6*capacity, len(z)) - 2.
+    return (1./(1.+np.exp(-logit))).round(2).astype('float32')
+
+
+def weighted_metrics(probs, signal, weights):
+    # metrics of the notebook (in %, S/100*100), predicting signal for probabilities above 0.5
+    pred = probs > 0.5
+    tp, fp = weights[pred & signal].sum(), weights[pred & ~signal].sum()
+    fn, tn = weights[~pred & signal].sum(), weights[~pred & ~signal].sum()
+    S = tp/np.sqrt(fp) if fp > 0 else 0.
+    return (np.array([(tp+tn)/(tp+tn+fp+fn),
+                      tp/(tp+fp) if tp+fp > 0 else 0.,
+                      tp/(tp+fn) if tp+fn > 0 else 0.,
+                      2*tp/(2*tp+fp+fn) if tp > 0 else 0.,
+                      S/100]).round(4)*100)
+
+
+def select_designs(designs):
+    # a number (first designs of the even grid, then of the wide one) or a list of layer tuples/names
+    if isinstance(designs, int):
+        return (Designs+Designs3)[:designs]
+    return [tuple(int(n) for n in design.strip('()').split(',') if n.strip()) if isinstance(design, str) else tuple(design)
+            for design in designs]
+
+
+def generate(store_dir, events=300_000, designs=155, seed=84, mass=300):
+    rng = np.random.default_rng(seed)
+    designs = select_designs(designs)
+
+    df_scatter = make_scatter(events, rng, mass_classes(mass))
+    write_table(df_scatter, os.path.join(store_dir, 'df_scatter'))
+
+    # shortlist: 3 random events per class, and their features scaled as for the MLP (StandardScaler)
+    df_shortlist = pd.concat([group.sample(n=3, random_state=rng) for _, group in df_scatter.groupby('Event', observed=True, sort=False)])
+    X = df_scatter[Features].to_numpy('float64')
+    mean, scale = X.mean(axis=0), X.std(axis=0)
+    scale[scale == 0] = 1.
+    df_shortlist_scaled = pd.DataFrame((df_shortlist[Features].to_numpy('float64')-mean)/scale, index=df_shortlist.index,
+                                       columns=[str(i) for i in range(len(Features))])
+    write_table(df_shortlist.astype({'Event': str, 'totalWeight': 'float64'}), os.path.join(store_dir, 'df_shortlist'))
+    write_table(df_shortlist_scaled, os.path.join(store_dir, 'df_shortlist_scaled'))
+    del X
+
+    # NN outputs written one design at a time: 155 designs of 10M events do not fit in memory at once
+    signal = (df_scatter['Event'] == f'DM_{mass}').to_numpy()
+    weights = df_scatter['totalWeight'].to_numpy('float64')
+    z = discriminant(df_scatter)
+    metrics = {}
+
+    def probs_columns():
+        yield 'Event', signal.astype('int8')
+        yield 'Weight', weights.astype('float32')
+        for design in designs:
+            probs = design_probs(design, z, signal, seed)
+            metrics[design_name(design)] = weighted_metrics(probs, signal, weights)
+            yield design_name(design), probs
+
+    write_columns(os.path.join(store_dir, 'df_probs'), df_scatter.index, probs_columns())
+    write_table(pd.DataFrame(metrics, index=pd.Index(Metrics, name='index')), os.path.join(store_dir, 'df_metrics'))
+    return df_scatter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write synthetic ATLAS-like data sets to the columnar store.')
+    parser.add_argument('store', help='store folder (used by the app as ATLAS_DATA_DIR)')
+    parser.add_argument('--events', type=int, default=300_000)
+    parser.add_argument('--designs', type=int, default=155, help='number of designs: the even grid, then the wide one')
+    parser.add_argument('--seed', type=int, default=84)
+    parser.add_argument('--dm', type=int, nargs='+', default=[300], help='DM masses of the signal (GeV), one folder each')
+    args = parser.parse_args(argv)
+    for mass in args.dm:
+        store = args.store if len(args.dm) == 1 else os.path.join(args.store, f'DM_{mass}')
+        df = generate(store, args.events, args.designs, args.seed, mass)
+        print(f"{len(df)} events ({', '.join(f'{event}: {count}' for event, count in df['Event'].value_counts(sort=False).items())}) "
+              f"and {args.designs} designs written to {store}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
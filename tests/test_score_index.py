@@ -0,0 +1,31 @@
+import os
+import numpy as np
+import pandas as pd
+from score_index import cached_score_index, build_score_index
+
+
+def probs(designs, rows=50, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'Event': rng.integers(0, 2, rows), 'Weight': rng.uniform(0.1, 2., rows)})
+    for design in designs:
+        df[design] = rng.uniform(0., 1., rows).astype('float32')
+    return df
+
+
+def test_no_designs(tmp_path):
+    # df_probs of a partial training run before any design finished
+    assert cached_score_index(str(tmp_path/'score_index'), probs([]), source=['x']) == {}
+    assert not os.path.exists(tmp_path/'score_index'/'meta.json')
+
+
+def test_saved_index_matches_built(tmp_path):
+    df = probs(['(2,)', '(4, 6)'])
+    saved = cached_score_index(str(tmp_path/'score_index'), df, source=['x'])
+    built = build_score_index(df)
+    assert list(saved) == list(built)
+    for design in built:
+        np.testing.assert_array_equal(saved[design].scores, built[design].scores)
+        np.testing.assert_allclose(saved[design].cum_all, built[design].cum_all)
+    # read back from the files on the next call
+    again = cached_score_index(str(tmp_path/'score_index'), df, source=['x'])
+    assert isinstance(again['(2,)'].scores, np.memmap)
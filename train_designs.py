@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from data_store import open_table, write_table, compact_dtypes
+from mlp_engine import design_name, save_weight_bank
+
+
+# Trains the grid of MLP designs shown by the app across a pool of processes, one model per worker.
+# Every finished design is checkpointed to <out>/checkpoints, so a run that is interrupted resumes
+# with the designs still missing. Once every design is trained the df_probs and df_metrics tables (and
+# the weight bank mlp_weights.npz) are written to <out> in the format the app reads; with --partial
+# they are written for the designs trained so far.
+#
+#   python train_designs.py <train table> <test table> <out folder> [--grid even wide all] [--workers 32] [--dm 300] [--partial]
+#
+# Tables are store folders (data_store.py) or CSV files with Event, totalWeight and the features.
+
+seed = 84
+Signal = 'DM_300'
+
+# MLP designs (combinations of hidden layers) from (2,) to (10, 10, 10)
+Designs = [(a,) for a in range(2,11,2)]
+Designs += [(a, b) for a in range(2,11,2) for b in range(2,11,2)]
+Designs += [(a, b, c) for a in range(2,11,2) for b in range(2,11,2) for c in range(2,11,2)]
+# and from (20, 20, 20) to (100, 100, 100)
+Designs3 = [(a, b, c) for a in range(20,120,20) for b in range(20,120,20) for c in range(20,120,20)]
+# every size the app's selectors offer, from (1,) to (10, 10, 10), odd ones included
+Designs_All = [(a,) for a in range(1,11)]
+Designs_All += [(a, b) for a in range(1,11) for b in range(1,11)]
+Designs_All += [(a, b, c) for a in range(1,11) for b in range(1,11) for c in range(1,11)]
+
+Grids = {'even': Designs, 'wide': Designs3, 'all': Designs_All}
+
+Metrics = ['Accuracy', 'Precision', 'Recall', 'f1-score', 'S']
+
+
+def split_table(df, signal=Signal):
+    X = df.drop(columns=['Event','totalWeight']).to_numpy(dtype='float64')
+    W = df['totalWeight'].to_numpy(dtype='float64')
+    Y = (df['Event'] == signal).to_numpy().astype('int64')  # binarise classes (1-Signal, 0-Background)
+    return X, Y, W
+
+
+def checkpoint_path(out_dir, design):
+    return os.path.join(out_dir, 'checkpoints', '-'.join(str(n) for n in design)+'.npz')
+
+
+# data of the worker processes, set once per worker by init_worker
+Worker = {}
+
+def init_worker(X_train, Y_train, X_test, Y_test, W_test, out_dir):
+    # one model per worker: keep BLAS single-threaded so workers do not compete for cores
+    from threadpoolctl import threadpool_limits
+    Worker.update(X_train=X_train, Y_train=Y_train, X_test=X_test, Y_test=Y_test, W_test=W_test,
+                  out_dir=out_dir, limits=threadpool_limits(1))
+
+
+def train_design(design):
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, confusion_matrix
+    start = time.time()
+    X_test, Y_test, W_test = Worker['X_test'], Worker['Y_test'], Worker['W_test']
+
+    MLP = MLPClassifier(hidden_layer_sizes = design,
+                        random_state = seed,
+                        shuffle=True,
+                        max_iter = 1000,        # def=200
+                        alpha=0.0001,           # def=0.0001
+                        activation='relu',      # def=’relu’
+                        )
+    MLP.fit(Worker['X_train'], Worker['Y_train'])
+    sig_prob = MLP.predict_proba(X_test)[:, 1]
+    pred = MLP.predict(X_test)
+
+    tn, fp, fn, tp = confusion_matrix(Y_test, pred, sample_weight=W_test).ravel()
+    S = tp/(fp**0.5)
+    metrics = np.array([accuracy_score(Y_test, pred, sample_weight=W_test),
+                        precision_score(Y_test, pred, sample_weight=W_test),
+                        recall_score(Y_test, pred, sample_weight=W_test),
+                        f1_score(Y_test, pred, sample_weight=W_test),
+                        S/100
+                        ]).round(4)*100
+
+    # written under a temporary name and renamed, so a killed worker never leaves half a checkpoint
+    path = checkpoint_path(Worker['out_dir'], design)
+    arrays = {f'W{i}': W for i, W in enumerate(MLP.coefs_)}
+    arrays.update({f'b{i}': b for i, b in enumerate(MLP.intercepts_)})
+    with open(path+'.tmp', 'wb') as f:
+        np.savez(f, probs=sig_prob.round(2).astype('float32'), metrics=metrics, **arrays)
+    os.replace(path+'.tmp', path)
+    return design, time.time()-start
+
+
+# fitted layers of a checkpoint in the shape of an MLPClassifier, for save_weight_bank
+class Checkpoint:
+    activation = 'relu'
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.probs = data['probs']
+            self.metrics = data['metrics']
+            n = sum(1 for key in data.files if key.startswith('W'))
+            self.coefs_ = [data[f'W{i}'] for i in range(n)]
+            self.intercepts_ = [data[f'b{i}'] for i in range(n)]
+
+
+def missing_designs(designs, out_dir):
+    return [design for design in designs if not os.path.exists(checkpoint_path(out_dir, design))]
+
+
+def collect(designs, test, Y_test, W_test, scaler, features, out_dir, partial=False):
+    # df_probs/df_metrics tables of every finished design, in grid order. The app serves the data folder
+    # as soon as the tables are there, so they are only written once every design is trained, unless
+    # partial is set (the app then shows the nearest trained design for sizes that are missing)
+    missing = missing_designs(designs, out_dir)
+    if missing and not partial:
+        raise RuntimeError(f'{len(missing)} of {len(designs)} designs are not trained yet')
+    Probs = {'Event': Y_test.astype('int8'), 'Weight': W_test.astype('float16')}
+    df_metrics = pd.DataFrame(index=pd.Index(Metrics, name='index'))
+    models = {}
+    for design in designs:
+        path = checkpoint_path(out_dir, design)
+        if not os.path.exists(path):
+            continue
+        models[design] = Checkpoint(path)
+        Probs[design_name(design)] = models[design].probs
+        df_metrics[design_name(design)] = models[design].metrics
+    df_probs = pd.DataFrame(Probs, index=pd.Index(test.index, name='index'))
+
+    write_table(compact_dtypes('df_probs', df_probs), os.path.join(out_dir, 'df_probs'))
+    write_table(df_metrics, os.path.join(out_dir, 'df_metrics'))
+    save_weight_bank(os.path.join(out_dir, 'mlp_weights.npz'), models, scaler, features)
+    return len(models)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the MLP design grid in parallel, resuming from checkpoints.')
+    parser.add_argument('train', help='training table (store folder or CSV file)')
+    parser.add_argument('test', help='testing table (store folder or CSV file)')
+    parser.add_argument('out', help='folder for checkpoints, df_probs, df_metrics and mlp_weights.npz')
+    parser.add_argument('--grid', nargs='+', choices=list(Grids), default=['even'], help='design grids to train')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--dm', type=int, default=300, help='DM mass of the signal event (GeV)')
+    parser.add_argument('--partial', action='store_true', help='write the tables even if some designs are not trained')
+    args = parser.parse_args(argv)
+
+    from sklearn.preprocessing import StandardScaler
+    train, test = open_table(args.train), open_table(args.test)
+    X_train, Y_train, W_train = split_table(train, f'DM_{args.dm}')
+    X_test, Y_test, W_test = split_table(test, f'DM_{args.dm}')
+    features = train.drop(columns=['Event','totalWeight']).columns.to_list()
+
+    # Initialise the Scaler and scale the sets
+    scaler = StandardScaler()
+    X_train_scaled = scaler.fit_transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    designs = list(dict.fromkeys(design for grid in args.grid for design in Grids[grid]))  # grids overlap
+    os.makedirs(os.path.join(args.out, 'checkpoints'), exist_ok=True)
+    todo = missing_designs(designs, args.out)
+    print(f'{len(designs)-len(todo)} of {len(designs)} designs already trained, {len(todo)} to go')
+
+    # largest designs first, so the pool does not end waiting for one slow model
+    todo.sort(key=lambda design: -sum(design))
+    failed = []
+    if todo:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(X_train_scaled, Y_train, X_test_scaled, Y_test, W_test, args.out)) as pool:
+            futures = {pool.submit(train_design, design): design for design in todo}
+            for i, future in enumerate(as_completed(futures), 1):
+                try:
+                    design, seconds = future.result()
+                    print(f'[{i}/{len(todo)}] {design}: {seconds:.0f} s')
+                except Exception as error:
+                    failed.append(futures[future])
+                    print(f'[{i}/{len(todo)}] {futures[future]} failed: {error!r}')
+
+    if failed:
+        print(f'{len(failed)} designs failed, run again to retry: {failed}')
+    if failed and not args.partial:
+        print(f'nothing written to {args.out} (--partial writes the tables of the trained designs)')
+        return 1
+    n = collect(designs, test, Y_test, W_test, scaler, features, args.out, args.partial)
+    print(f'df_probs, df_metrics and mlp_weights.npz written to {args.out} ({n} designs)')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import os
+import gc
+import sys
+import threading
+import importlib.util
+
+
+# WSGI entry point for a multi-process server, e.g.
+#
+#   gunicorn -c gunicorn.conf.py wsgi:server
+#
+# The app module (its file name has spaces, so it is loaded by path) reads the data sets, and
+# warm_up fills its caches depending on ATLAS_PRELOAD:
+#   1 (default)  here, before serving: with preload_app the master does it once before forking, and the
+#                workers share those pages copy-on-write instead of loading their own copies
+#   background   in a thread of each serving process, which serves (and answers /health with 503) meanwhile;
+#                threads do not survive a fork, so under a forking server (ATLAS_WARM_UP_AFTER_FORK, set by
+#                gunicorn.conf.py) the thread is started in each worker by the post_fork hook instead
+#   0            not at all, caches fill on first use
+
+path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Visualisation tool NN.py')
+spec = importlib.util.spec_from_file_location('visualisation_tool_nn', path)
+app_module = importlib.util.module_from_spec(spec)
+sys.modules[spec.name] = app_module   # lets Dash find the assets folder next to it
+spec.loader.exec_module(app_module)
+
+create_app = app_module.create_app
+app = app_module.NN
+server = app_module.server
+
+
+def start_background_warm_up():
+    threading.Thread(target=app_module.warm_up, daemon=True).start()
+
+
+Preload = os.environ.get('ATLAS_PRELOAD', '1')
+if Preload == 'background':
+    # a thread started in the master would not exist in the workers, and a worker forked while it holds
+    # a cache lock would never see that lock released
+    if os.environ.get('ATLAS_WARM_UP_AFTER_FORK') != '1':
+        start_background_warm_up()
+else:
+    app_module.warm_up(preload_caches=Preload != '0')
+# keep the loaded objects out of the collector, so it does not touch (and copy) their pages in the workers
+gc.freeze()